@@ -0,0 +1,45 @@
+# From repo root, run with 'python benchmarks/bench_command_latency.py'
+# Measures the round trip overhead of no-op commands sent to a CommNode
+
+import os, sys
+from time import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from blenderneuron.commnode import CommNode
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    mean = sum(timings) / len(timings)
+    median = timings[len(timings) // 2]
+    print('%-40s mean: %8.3f ms  median: %8.3f ms  max: %8.3f ms' %
+          (label, mean * 1000, median * 1000, timings[-1] * 1000))
+
+
+def measure(function, repeats):
+    timings = []
+
+    for i in range(repeats):
+        start = time()
+        function()
+        timings.append(time() - start)
+
+    return timings
+
+
+def main(repeats=500):
+    with CommNode("Blender") as blender_node:
+        with CommNode("NEURON") as neuron_node:
+
+            # Queue + completion overhead, without the XML-RPC transport
+            report('In-process _run_lambda(no-op)', measure(lambda: neuron_node._run_lambda(lambda: None), repeats))
+
+            # Full round trip: XML-RPC request + queueing + completion
+            neuron_client = blender_node.client
+            neuron_client.run_command('pass')
+            report('XML-RPC run_command("pass")', measure(lambda: neuron_client.run_command('pass'), repeats))
+
+
+if __name__ == '__main__':
+    main()
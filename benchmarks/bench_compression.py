@@ -0,0 +1,84 @@
+# From repo root, run with 'python benchmarks/bench_compression.py'
+# Compares payload codecs on a synthetic group payload (random-walk morphologies with recorded voltages)
+# Reports the compression ratio, codec CPU time, and the estimated total transfer time over several links
+
+import os, sys
+from time import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from blenderneuron import compression
+from blenderneuron.activity import round_significant
+from blenderneuron.utils import pack
+
+# Link throughputs in bytes/s. XML-RPC sends payloads as base64 (4/3 larger)
+links = [
+    ('1 Gbit/s', 125e6),
+    ('100 Mbit/s', 12.5e6),
+]
+
+
+def make_group_payload(cells=50, sections_per_cell=40, points_per_section=20, time_steps=400):
+    rng = np.random.RandomState(0)
+    roots = []
+
+    times = np.arange(time_steps, dtype=np.float64) * 0.25
+
+    for c in range(cells):
+        for s in range(sections_per_cell):
+            steps = rng.normal(0, 1, (points_per_section, 3))
+            coords = np.cumsum(steps, axis=0).astype(np.float32).reshape(-1)
+            radii = np.round(rng.uniform(0.2, 2.0, points_per_section), 2).astype(np.float32)
+
+            voltage = -65 + 30 * np.sin(times / (5 + c)) + rng.normal(0, 0.5, time_steps)
+
+            roots.append({
+                "name": "cell[%s].dend[%s]" % (c, s),
+                "coords": coords,
+                "radii": radii,
+                "activity": {
+                    "name": "cell[%s].dend[%s]" % (c, s),
+                    "times": times,
+                    "values": round_significant(voltage).astype(np.float32),
+                },
+            })
+
+    return [{"name": "Group.000", "roots": roots}]
+
+
+def measure(function, repeats):
+    start = time()
+
+    for i in range(repeats):
+        result = function()
+
+    return (time() - start) / repeats, result
+
+
+def main(repeats=3):
+    data = pack(make_group_payload())
+
+    print('Payload: %.1f MB' % (len(data) / 1e6))
+    print('%-8s %7s %12s %12s' % ('codec', 'ratio', 'encode ms', 'decode ms') +
+          ''.join('%16s' % (name + ' ms') for name, _ in links))
+
+    for codec in compression.available_codecs():
+        encode_time, encoded = measure(lambda: compression.encode(data, codec), repeats)
+        decode_time, _ = measure(lambda: compression.decode(encoded), repeats)
+
+        wire_bytes = len(encoded) * 4.0 / 3.0
+
+        print('%-8s %7.2f %12.1f %12.1f' % (codec, len(data) / float(len(encoded)),
+                                            encode_time * 1000, decode_time * 1000) +
+              ''.join('%16.1f' % ((encode_time + decode_time + wire_bytes / speed) * 1000) for _, speed in links))
+
+    # What CommNode.compress() would choose
+    for remote in (False, True):
+        chosen = compression.select_codec(len(data), remote, compression.available_codecs())
+        print('Selected for %s link: %s' % ('a remote' if remote else 'the local', chosen))
+
+
+if __name__ == '__main__':
+    main()
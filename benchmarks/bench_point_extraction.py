@@ -0,0 +1,86 @@
+# From repo root, run with 'python benchmarks/bench_point_extraction.py'
+# Compares the per-point h.x3d() loop with the bulk NeuronSection.get_coords_and_radii() extraction
+# on a synthetic network of many branched cells
+
+import os, sys
+from time import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from neuron import h
+from blenderneuron.nrn.neuronsection import NeuronSection
+
+
+def make_network(cells=200, dendrites=20, points_per_dendrite=50):
+    rng = np.random.RandomState(0)
+    sections = []
+
+    for c in range(cells):
+        soma = h.Section(name="cell%s_soma" % c)
+        h.pt3dadd(c * 100.0, 0, 0, 20, sec=soma)
+        h.pt3dadd(c * 100.0 + 20, 0, 0, 20, sec=soma)
+        sections.append(soma)
+
+        for d in range(dendrites):
+            dend = h.Section(name="cell%s_dend%s" % (c, d))
+            dend.connect(soma(1))
+
+            points = np.cumsum(rng.normal(0, 2, (points_per_dendrite, 3)), axis=0) + [c * 100.0 + 20, 0, 0]
+
+            for x, y, z in points:
+                h.pt3dadd(x, y, z, 2, sec=dend)
+
+            sections.append(dend)
+
+    return sections
+
+
+def loop_extraction(nrn_section):
+    # The previous implementation: four HOC calls per point
+    point_count = int(h.n3d(sec=nrn_section))
+    coords = [None] * point_count * 3
+    radii = [None] * point_count
+
+    for c in range(point_count):
+        ci = c * 3
+        coords[ci] = h.x3d(c, sec=nrn_section)
+        coords[ci + 1] = h.y3d(c, sec=nrn_section)
+        coords[ci + 2] = h.z3d(c, sec=nrn_section)
+
+        radii[c] = h.diam3d(c, sec=nrn_section) / 2.0
+
+    return coords, radii
+
+
+def bulk_extraction(nrn_section):
+    section = NeuronSection()
+    section.nrn_section = nrn_section
+    section.get_coords_and_radii()
+
+    return section.coords, section.radii
+
+
+def main():
+    sections = make_network()
+    point_count = sum(int(sec.n3d()) for sec in sections)
+
+    print('%s sections, %s 3D points' % (len(sections), point_count))
+
+    results = {}
+
+    for label, extract in (('h.x3d() loop', loop_extraction), ('bulk', bulk_extraction)):
+        start = time()
+        results[label] = [extract(sec) for sec in sections]
+        elapsed = time() - start
+
+        print('%-15s %8.1f ms  %6.2f Mpoints/s' % (label, elapsed * 1000, point_count / elapsed / 1e6))
+
+    # Same points (within float32 precision)
+    for (loop_coords, _), (bulk_coords, _) in zip(results['h.x3d() loop'], results['bulk']):
+        assert np.allclose(loop_coords, bulk_coords, rtol=1e-6)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# From repo root, run with 'python benchmarks/bench_recording.py'
+# Compares the simulation time with 3D segment activity recorded by the NetStim callback collector
+# (reading each segment, or gathering with the precomputed sampling plan) and by the Vector.record engine
+
+import os, sys
+from time import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from neuron import h
+from blenderneuron.nrn.neuronnode import NeuronNode
+
+
+def make_cells(cells=20, dendrites=10, points_per_dendrite=20):
+    sections = []
+
+    for c in range(cells):
+        soma = h.Section(name="cell%s_soma" % c)
+        soma.insert("hh")
+        h.pt3dadd(c * 100.0, 0, 0, 20, sec=soma)
+        h.pt3dadd(c * 100.0 + 20, 0, 0, 20, sec=soma)
+        sections.append(soma)
+
+        for d in range(dendrites):
+            dend = h.Section(name="cell%s_dend%s" % (c, d))
+            dend.connect(soma(1))
+            dend.nseg = 9
+
+            for p in range(points_per_dendrite):
+                h.pt3dadd(c * 100.0 + 20 + p * 5, d * 5, 0, 2, sec=dend)
+
+            sections.append(dend)
+
+    return sections
+
+
+def main():
+    with NeuronNode() as node:
+        sections = make_cells()
+        root_names = [sec.name() for sec in sections if sec.parentseg() is None]
+
+        h.tstop = 100
+        node.get_roots()
+
+        print('%s cells, %s sections, tstop %s ms' % (len(root_names), len(sections), h.tstop))
+
+        for engine in ('per-point', 'callback', 'vector'):
+            node.initialize_groups([{
+                "name": "Group.000",
+                "roots": [{"name": name} for name in root_names],
+                "record_activity": True,
+                "record_variable": "v",
+                "recording_granularity": "3D Segment",
+                "recording_period": 0.1,
+                "recording_time_start": 0,
+                "recording_time_end": 0,
+                "recording_engine": 'vector' if engine == 'vector' else 'callback',
+            }], send_back=False)
+
+            if engine == 'per-point':
+                node.groups["Group.000"].sampling_plan = None
+
+            start = time()
+            node.run_recording_groups()
+            elapsed = time() - start
+
+            print('%-10s %8.1f ms' % (engine, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
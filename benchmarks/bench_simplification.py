@@ -0,0 +1,67 @@
+# From repo root, run with 'python benchmarks/bench_simplification.py'
+# Compares the time to simplify many activity traces that share a time axis, one trace at a time
+# (Activity.simplify), all traces together (simplify_traces), and all traces together across a process pool
+# with a worker per CPU core. The pool only helps with more than one core.
+
+import os, sys
+from time import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from blenderneuron.activity import Activity, simplify_traces
+
+
+def make_traces(count, samples, seed=0):
+    """
+    Makes Vm-like traces: a random walk around rest with a few spikes
+    """
+    random = np.random.RandomState(seed)
+    times = np.arange(samples) * 0.1
+
+    values = -65 + np.cumsum(random.normal(scale=0.05, size=(count, samples)), axis=1)
+    spikes = random.rand(count, samples) < 0.002
+    values[spikes] += 80
+
+    activities = []
+
+    for row in values:
+        activity = Activity()
+        activity.values = row
+        activity.set_time_base(times)
+        activities.append(activity)
+
+    return times, activities
+
+
+def main():
+    epsilon = 0.1
+
+    for count, samples in ((100, 1000), (1000, 1000), (10000, 100)):
+        times, activities = make_traces(count, samples)
+
+        start = time()
+        for activity in activities:
+            activity.simplify(epsilon)
+        per_trace = time() - start
+        kept = sum(len(activity.values) for activity in activities)
+
+        elapsed = {}
+
+        for workers in (1, 0):
+            times, activities = make_traces(count, samples)
+
+            start = time()
+            simplify_traces(times, activities, epsilon, workers=workers)
+            elapsed[workers] = time() - start
+
+            assert kept == sum(len(activity.values) for activity in activities)
+
+        print('%6s traces x %5s samples: per-trace %8.1f ms, batched %8.1f ms, %s processes %8.1f ms '
+              '(%s points kept)' % (count, samples, per_trace * 1000, elapsed[1] * 1000, os.cpu_count(),
+                                    elapsed[0] * 1000, kept))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# From repo root, run with 'python benchmarks/bench_worker_pool.py'
+# Measures queued task throughput under a mixed load of shared (read-only) and exclusive tasks,
+# for several worker pool sizes
+
+import os, sys
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from blenderneuron.commnode import CommNode
+
+data = np.random.RandomState(0).uniform(size=2 * 10 ** 6)
+
+
+def read_task():
+    # NumPy releases the GIL while sorting, so this stands in for read-only work that can overlap
+    # (e.g. array extraction, compression). Scaling requires more than one CPU core.
+    return float(np.sort(data)[0])
+
+
+def write_task():
+    return float(np.sort(data)[-1])
+
+
+def run_mixed_load(node, tasks=64, exclusive_every=16):
+    start = time()
+
+    queued = [
+        node._enqueue_task(write_task if i % exclusive_every == 0 else read_task, i % exclusive_every != 0)
+        for i in range(tasks)
+    ]
+
+    for task in queued:
+        task["done"].wait()
+
+    return tasks / (time() - start)
+
+
+def main():
+    with CommNode("NEURON") as node:
+        baseline = None
+
+        for pool_size in (1, 2, 4, 8):
+            if node.worker_pool is not None:
+                node.worker_pool.shutdown(wait=True)
+
+            node.worker_pool = ThreadPoolExecutor(pool_size) if pool_size > 1 else None
+
+            throughput = run_mixed_load(node)
+            baseline = baseline or throughput
+
+            print('Pool size %s: %7.1f tasks/s  (%.2fx)' % (pool_size, throughput, throughput / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,51 +1,531 @@
+import atexit, math, os
+
 try:
     import numpy as np
     numpy_available = True
-
-    from blenderneuron.blender.utils import rdp
-except:
+except ImportError:
     numpy_available = False
 
+# Process pools used by simplify_traces(), by number of workers. Starting processes is slow, so they are reused.
+_process_pools = {}
+
+# Fewer traces than this are simplified in the calling process
+PARALLEL_MIN_TRACES = 512
+
+def round_significant(values, digits=4):
+    """
+    Vectorized equivalent of float('%.3E' % v) for each value (for digits=4)
+
+    :param values: A list or array of floats
+    :param digits: The number of significant digits to keep
+    :return: A float64 array of the rounded values
+    """
+    values = np.array(values, dtype=np.float64)
+    rounded = np.isfinite(values) & (values != 0)
+
+    magnitude = np.floor(np.log10(np.abs(values[rounded])))
+    scale = 10.0 ** (digits - 1 - magnitude)
+
+    values[rounded] = np.round(values[rounded] * scale) / scale
+
+    return values
+
+
+# Ways to reduce the precision of recorded values before sending them (see quantize())
+QUANTIZATIONS = ('significant', 'float16', 'fixed')
+
+# Range of the 'fixed' quantization integers
+_fixed_levels = 2 ** 16 - 1
+_fixed_min = -2 ** 15
+
+
+def quantize(values, method='significant'):
+    """
+    Reduces the precision of values, which helps with compression when sending them from NRN to Blender.
+    For display, more precision is not necessary.
+
+    :param values: A list or array of floats
+    :param method: 'significant' keeps 4 significant digits (as float32). 'float16' uses half precision floats.
+        'fixed' maps the range of the values to 16 bit integers.
+    :return: An activity dict entry with the quantized "values", plus "scale" and "offset" for 'fixed'.
+        Use dequantize() to get the values back.
+    """
+    if method == 'float16':
+        return {"values": np.asarray(values, dtype=np.float16)}
+
+    if method == 'fixed':
+        values = np.asarray(values, dtype=np.float64)
+
+        if len(values) == 0:
+            return {"values": values.astype(np.int16), "scale": 1.0, "offset": 0.0}
+
+        offset = float(values.min())
+        scale = (float(values.max()) - offset) / _fixed_levels or 1.0
+
+        return {
+            "values": (np.round((values - offset) / scale) + _fixed_min).astype(np.int16),
+            "scale": scale,
+            "offset": offset,
+        }
+
+    if method != 'significant':
+        raise ValueError("Unknown quantization: " + str(method) + ". Expected one of: " + str(QUANTIZATIONS))
+
+    return {"values": round_significant(values).astype(np.float32)}
+
+
+def dequantize(source):
+    """
+    :param source: An activity dict, with values created by quantize()
+    :return: The values as a float64 array, which Blender properties and keyframes accept
+        (or unchanged, if NumPy is not available)
+    """
+    values = source["values"]
+
+    if not numpy_available:
+        return values
+
+    if "scale" in source:
+        return (np.asarray(values, dtype=np.float64) - _fixed_min) * source["scale"] + source["offset"]
+
+    # Restore the 4 significant digits exactly, instead of the nearest float32
+    if getattr(values, "dtype", None) == np.float32:
+        return round_significant(values)
+
+    return np.asarray(values, dtype=np.float64)
+
+
+# Line simplification algorithm using Numpy from:
+# https://github.com/fhirschmann/rdp/issues/7
+
+def line_dists(points, start, end):
+    if np.all(start == end):
+        return np.linalg.norm(points - start, axis=1)
+
+    vec = end - start
+    cross = np.cross(vec, start - points)
+    return np.divide(abs(cross), np.linalg.norm(vec))
+
+
+def rdp(M, epsilon=0):
+    """
+    Line simplification algorithm using the Ramer-Douglas-Peucker algorithm.
+    This is the iterative version to avoid recursion.
+
+    :param M: Array of points [[x1, y1], [x2, y2], ...]
+    :param epsilon: Tolerance value for simplification
+    :return: Simplified array of points
+    """
+    M = np.array(M)
+
+    return M[rdp_indices(M, epsilon)]
+
+
+def rdp_indices(M, epsilon=0):
+    """
+    Like rdp(), but returns the indices of the points to keep
+
+    :return: Sorted int array of the indices of the simplified points in M
+    """
+    M = np.asarray(M)
+    stack = [(0, len(M) - 1)]
+    indices = [0, len(M) - 1]
+
+    while stack:
+        start_idx, end_idx = stack.pop()
+        start = M[start_idx]
+        end = M[end_idx]
+
+        if end_idx - start_idx <= 1:
+            continue
+
+        segment = M[start_idx + 1:end_idx]
+        if len(segment) == 0:
+            continue
+
+        dists = line_dists(segment, start, end)
+        index = np.argmax(dists)
+        dmax = dists[index]
+
+        if dmax > epsilon:
+            # Index of the point with the maximum distance in the original array
+            actual_index = index + start_idx + 1
+            indices.append(actual_index)
+            # Add the two new segments to the stack
+            stack.append((start_idx, actual_index))
+            stack.append((actual_index, end_idx))
+
+    # Sort the indices (the first and last are the same point if M has only one)
+    return np.unique(indices)
+
+def rdp_batch(times, values, epsilon=0):
+    """
+    Batched version of rdp_indices() for many traces that share a time axis. Instead of splitting one
+    segment at a time, every iteration splits all the open segments of all the traces at once.
+
+    :param times: Array of the N sample times
+    :param values: Traces x N array of values
+    :param epsilon: Tolerance value for simplification
+    :return: A list with a sorted int array of the indices of the simplified points of each trace
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    traces, samples = values.shape
+
+    if samples == 0:
+        return [np.empty(0, dtype=np.int64) for _ in range(traces)]
+
+    positions = np.arange(samples)
+
+    keep = np.zeros(values.shape, dtype=bool)
+    keep[:, 0] = keep[:, -1] = True
+
+    # Points inside segments that have not been found to be within epsilon yet
+    active = ~keep
+
+    while active.any():
+        # The kept points before and after each point are the ends of its segment
+        start = np.maximum.accumulate(np.where(keep, positions, 0), axis=1)
+        end = np.minimum.accumulate(np.where(keep, positions, samples - 1)[:, ::-1], axis=1)[:, ::-1]
+
+        trace, point = np.nonzero(active)
+        start, end = start[trace, point], end[trace, point]
+
+        # Distances of the points from their segment lines (same as line_dists())
+        vec_t = times[end] - times[start]
+        vec_v = values[trace, end] - values[trace, start]
+        dists = np.abs(vec_t * (values[trace, start] - values[trace, point]) -
+                       vec_v * (times[start] - times[point])) / np.hypot(vec_t, vec_v)
+
+        # The points of a segment are contiguous, so each segment is a run of the same (trace, start)
+        segment = trace * samples + start
+        first = np.flatnonzero(np.r_[True, segment[1:] != segment[:-1]])
+        counts = np.diff(np.r_[first, len(segment)])
+
+        dmax = np.maximum.reduceat(dists, first)
+
+        # Split at the first point with the maximum distance, like np.argmax()
+        is_max = np.flatnonzero(dists == np.repeat(dmax, counts))
+        split = is_max[np.r_[True, segment[is_max[1:]] != segment[is_max[:-1]]]]
+
+        split = split[dmax > epsilon]
+        keep[trace[split], point[split]] = True
+
+        # Segments within epsilon are done
+        done = np.repeat(dmax <= epsilon, counts)
+        active[trace[done], point[done]] = False
+        active[trace[split], point[split]] = False
+
+    trace, point = np.nonzero(keep)
+
+    return np.split(point, np.cumsum(np.bincount(trace, minlength=traces))[:-1])
+
+
+def simplify_traces(times, activities, epsilon=0.0, batch_size=1024, workers=1):
+    """
+    Simplifies many activities that share the times with rdp_batch(), like calling Activity.simplify()
+    on each.
+
+    :param times: The shared times of the activities
+    :param activities: The activities to simplify. Ones that have a different number of values than times are
+        simplified one by one.
+    :param batch_size: The number of traces to simplify at once. Limits the memory used.
+    :param workers: The number of processes to simplify the traces with (see simplify_in_processes).
+        0 uses all CPU cores. 1 simplifies in the calling process.
+    """
+    if not numpy_available:
+        return
+
+    times = np.asarray(times, dtype=np.float64)
+    batch = []
+
+    for activity in activities:
+        if activity.time_indices is None and len(activity.values) == len(times) > 0:
+            batch.append(activity)
+        else:
+            activity.simplify(epsilon)
+
+    if workers == 0:
+        workers = os.cpu_count() or 1
+
+    if workers > 1 and len(batch) >= PARALLEL_MIN_TRACES:
+        simplify_in_processes(times, batch, epsilon, batch_size, workers)
+        return
+
+    for i in range(0, len(batch), batch_size):
+        traces = batch[i:i + batch_size]
+        values = np.array([activity.values for activity in traces], dtype=np.float64)
+
+        for activity, row, kept in zip(traces, values, rdp_batch(times, values, epsilon)):
+            activity.values = row[kept]
+            activity.time_indices = kept.astype(np.int32)
+
+
+def simplify_in_processes(times, activities, epsilon, batch_size, workers):
+    """
+    Simplifies the activities with a pool of worker processes. The values are copied once into a shared memory
+    block, and each worker marks the points to keep of its batch of traces in a second block.
+    Only the shared memory block names and the batch bounds are sent to the workers.
+
+    The workers are started with the default multiprocessing start method (fork or spawn). Spawned workers
+    run sys.executable, which is Blender's bundled Python in Blender 2.91+, and import this module, which does
+    not need bpy.
+    """
+    from multiprocessing import shared_memory
+
+    shape = (len(activities), len(times))
+    values_memory = shared_memory.SharedMemory(create=True, size=shape[0] * shape[1] * 8)
+    keep_memory = shared_memory.SharedMemory(create=True, size=shape[0] * shape[1])
+
+    values = np.ndarray(shape, dtype=np.float64, buffer=values_memory.buf)
+    keep = np.ndarray(shape, dtype=bool, buffer=keep_memory.buf)
+
+    try:
+        for row, activity in zip(values, activities):
+            row[:] = activity.values
+
+        keep[:] = False
+
+        # At least one batch per worker
+        batch_size = min(batch_size, int(math.ceil(float(shape[0]) / workers)))
+
+        futures = [
+            get_process_pool(workers).submit(_simplify_shared_batch, values_memory.name, keep_memory.name,
+                                             shape, times, start, min(start + batch_size, shape[0]), epsilon)
+            for start in range(0, shape[0], batch_size)
+        ]
+
+        for future in futures:
+            future.result()
+
+        for activity, row, kept in zip(activities, values, keep):
+            indices = np.flatnonzero(kept)
+            activity.values = row[indices]
+            activity.time_indices = indices.astype(np.int32)
+
+    finally:
+        # The arrays must not outlive the shared memory
+        del values, keep
+
+        for memory in (values_memory, keep_memory):
+            memory.close()
+            memory.unlink()
+
+
+def _simplify_shared_batch(values_name, keep_name, shape, times, start, stop, epsilon):
+    """
+    Runs in a worker process. Marks the points to keep of the traces from start to stop in the shared memory.
+    """
+    from multiprocessing import shared_memory
+
+    values_memory = shared_memory.SharedMemory(name=values_name)
+    keep_memory = shared_memory.SharedMemory(name=keep_name)
+
+    values = np.ndarray(shape, dtype=np.float64, buffer=values_memory.buf)
+    keep = np.ndarray(shape, dtype=bool, buffer=keep_memory.buf)
+
+    try:
+        for row, kept in enumerate(rdp_batch(times, values[start:stop], epsilon), start):
+            keep[row, kept] = True
+
+    finally:
+        del values, keep
+
+        values_memory.close()
+        keep_memory.close()
+
+
+def get_process_pool(workers):
+    """
+    :return: A process pool with the number of workers, which is shut down at exit
+    """
+    if workers not in _process_pools:
+        from concurrent.futures import ProcessPoolExecutor
+        _process_pools[workers] = ProcessPoolExecutor(workers)
+
+    return _process_pools[workers]
+
+
+@atexit.register
+def shutdown_process_pools():
+    for pool in _process_pools.values():
+        pool.shutdown()
+
+    _process_pools.clear()
+
+
+# End line simplification
+
+
+class SampleBuffer:
+    """
+    A preallocated array of samples (or of rows of samples). When full, it grows, or in rolling mode,
+    overwrites the oldest samples - keeping a window of the latest ones.
+    """
+
+    def __init__(self, capacity, width=None, rolling=False, dtype=None):
+        shape = (capacity,) if width is None else (capacity, width)
+
+        self.data = np.empty(shape, dtype=np.float64 if dtype is None else dtype)
+        self.rolling = rolling
+        self.count = 0  # Number of samples ever appended
+
+    def __len__(self):
+        return min(self.count, len(self.data))
+
+    def append(self, sample):
+        capacity = len(self.data)
+
+        if self.count == capacity and not (self.rolling and capacity > 0):
+            grown = np.empty((max(capacity * 2, 16),) + self.data.shape[1:], dtype=self.data.dtype)
+            grown[:capacity] = self.data
+            self.data = grown
+            capacity = len(grown)
+
+        self.data[self.count % capacity] = sample
+        self.count += 1
+
+    def get(self):
+        """
+        :return: The samples, oldest first. A view of the buffer, unless a rolling buffer wrapped around.
+        """
+        capacity = len(self.data)
+
+        if self.count <= capacity:
+            return self.data[:self.count]
+
+        start = self.count % capacity
+
+        return np.concatenate((self.data[start:], self.data[:start]))
+
+
 class Activity:
 
-    def __init__(self):
-        self.times = []
-        self.values = []
+    def __init__(self, capacity=None, rolling=False):
+        """
+        :param capacity: If set, times and values are stored in preallocated arrays of this size (see allocate())
+        :param rolling: Whether to only keep the latest capacity samples
+        """
+        self.clear()
+
+        if capacity is not None and numpy_available:
+            self.allocate(capacity, rolling)
+
+    @property
+    def times(self):
+        times = self._times.get() if type(self._times) is SampleBuffer else self._times
+
+        # After simplification, only the indices of the kept times are stored
+        if self.time_indices is not None:
+            return np.asarray(times)[self.time_indices]
+
+        return times
+
+    @times.setter
+    def times(self, value):
+        """
+        Sets the times of all values. E.g. the group time base, which is shared by the traces of all sections.
+        """
+        self._times = value
+        self.time_indices = None
+
+    def set_time_base(self, times):
+        """
+        Sets the times that the values (or the time_indices of simplified values) refer to, without copying them
+        """
+        self._times = times
+
+    @property
+    def values(self):
+        return self._values.get() if type(self._values) is SampleBuffer else self._values
+
+    @values.setter
+    def values(self, value):
+        self._values = value
 
     def clear(self):
         self.times = []
         self.values = []
 
-    def to_dict(self):
-        # Ensure times are a python list
-        times = self.times if type(self.times) is list else list(self.times)
+    def allocate(self, capacity, rolling=False):
+        """
+        Replaces the times and values with empty preallocated arrays, to which add_time() and add_value()
+        write without allocating. In rolling mode, only the latest capacity samples are kept.
+        """
+        self.times = SampleBuffer(capacity, rolling=rolling)
+        self.values = SampleBuffer(capacity, rolling=rolling)
 
-        # Trim value floats to 4 sig digits - using sci notation
-        # Using more for display purposes is not necessary
-        # Trimming helps with compression when sending values from NRN to Blender
-        values = [float('%.3E' % v) for v in self.values]
+    def add_time(self, time):
+        self._times.append(time)
 
-        return {
-            "times": times,
-            "values": values,
-        }
+    def add_value(self, value):
+        self._values.append(value)
+
+    def to_dict(self, as_arrays=False, quantization='significant', include_times=True):
+        """
+        :param as_arrays: Leave times and values as arrays for the binary wire format
+        :param quantization: How to reduce the precision of the values (see quantize())
+        :param include_times: False for traces that use the group time base, which is sent once per group. The
+            indices of the times are still included for simplified traces.
+        """
+        if not numpy_available:
+            # Trim value floats to 4 sig digits - using sci notation
+            result = {"values": [float('%.3E' % v) for v in self.values]}
+
+            if include_times:
+                result["times"] = list(self.times)
+
+            return result
+
+        if as_arrays or quantization != 'significant':
+            result = quantize(self.values, quantization)
+        else:
+            # As text, float32 values would be written with spurious digits
+            result = {"values": round_significant(self.values)}
+
+        if include_times:
+            result["times"] = np.asarray(self.times, dtype=np.float64)
+
+        elif self.time_indices is not None:
+            result["time_indices"] = self.time_indices
+
+        if not as_arrays:
+            for key in ("times", "values", "time_indices"):
+                if key in result:
+                    result[key] = np.asarray(result[key]).tolist()
+
+        return result
 
     def from_dict(self, source):
-        self.times, self.values = source["times"], source["values"]
+        """
+        Traces without "times" use the group time base, which is set later (see
+        BlenderRootGroup.set_activity_times())
+        """
+        self.times, self.values = source.get("times", []), dequantize(source)
+
+        if source.get("time_indices") is not None:
+            self.time_indices = np.asarray(source["time_indices"], dtype=np.int32)
+
         return self
 
     def simplify(self, epsilon=0.0):
+        """
+        Removes the values that can be interpolated from their neighbors within epsilon. The times are not
+        copied - only the indices of the kept values in the (shared) times are stored.
+        """
         if len(self.values) * len(self.times) == 0 or not numpy_available:
             return
 
+        times = np.asarray(self.times)
+        values = np.asarray(self.values)
 
-        # Make a matrix where times and values are columns
-        formatted = np.vstack((self.times, self.values)).T
-
-        # Run simplification algorithm
-        simplified = rdp(formatted, epsilon).T
-
-        # Split the result matrix back to individual times and values columns
-        self.times, self.values = simplified[0:2]
+        # Make a matrix where times and values are columns, and run the simplification algorithm
+        kept = rdp_indices(np.column_stack((times, values)), epsilon)
 
+        if self.time_indices is not None:
+            kept_times = self.time_indices[kept]
+        else:
+            kept_times = kept
 
+        self.values = values[kept]
+        self.time_indices = kept_times.astype(np.int32)
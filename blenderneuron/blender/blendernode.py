@@ -4,9 +4,17 @@ from blenderneuron.blender.blenderroot import BlenderRoot
 from blenderneuron.blender.blenderrootgroup import *
 from blenderneuron.commnode import CommNode
 
+try:
+    import xmlrpclib
+except:
+    import xmlrpc.client as xmlrpclib
+
 
 class BlenderNode(CommNode):
     def __init__(self, *args, **kwargs):
+        # The version token of the NEURON root list that root_index reflects (see NeuronNode.get_roots_delta())
+        self.roots_version = None
+
         super(BlenderNode, self).__init__("Blender", *args, **kwargs)
 
     @property
@@ -36,12 +44,23 @@ class BlenderNode(CommNode):
         # Keep track which roots have been removed from NRN
         roots_to_delete = set(self.root_index.keys())
 
-        # Get the list of root sections from NEURON
+        # Get the changes to the list of root sections from NEURON
         try:
-            root_data = self.client.get_roots()
+            try:
+                delta = self.client.get_roots_delta(self.roots_version)
+
+            except xmlrpclib.Fault:
+                # NEURON nodes without root list versions only send the full list
+                delta = {"version": None, "full": True, "added": self.client.get_roots(), "removed": []}
+
+            self.roots_version = delta["version"]
+
+            # Only the listed roots were removed
+            if not delta["full"]:
+                roots_to_delete = set(name for name in delta["removed"] if name in self.root_index)
 
             # Update new or existing root entries
-            for i, root_info in enumerate(root_data):
+            for root_info in delta["added"]:
                 name = root_info["name"]
 
                 existing_root = self.root_index.get(name)
@@ -51,8 +70,15 @@ class BlenderNode(CommNode):
                     existing_root.index = root_info["index"]
                     existing_root.name = root_info["name"]
 
+                    # The index shifts when earlier roots are removed
+                    for group in self.groups.values():
+                        ui_root = group.ui_group.root_entries.get(name)
+
+                        if ui_root is not None:
+                            ui_root.index = root_info["index"]
+
                     # Don't remove roots that previously existed and are present
-                    roots_to_delete.remove(name)
+                    roots_to_delete.discard(name)
 
                 # Add a new root
                 else:
@@ -66,7 +92,8 @@ class BlenderNode(CommNode):
                         new_root.add_to_UI_group(group.ui_group)
 
         except ConnectionRefusedError:
-            root_data = []
+            # All roots are removed - the next listing is a full one
+            self.roots_version = None
 
         finally:
             # Delete removed roots
@@ -86,37 +113,79 @@ class BlenderNode(CommNode):
 
         return name
 
-    def get_group_data_from_neuron(self, group_list):
+    def import_groups_from_neuron(self, group_list):
 
-        # Convert blender groups to skeletal dicts (needed for XML rcp with NRN)
-        # These dicts contain basic information (e.g. no 3D data, activity)
         blender_groups = self.get_group_dicts(group_list)
 
-        # Send a request to NRN for the selected groups
-        compressed = self.client.initialize_groups(blender_groups)
+        # Request the groups as a stream - their roots are received in batches
+        # This bounds the memory used for each transfer on both ends
+        stream_id = self.client.initialize_groups(blender_groups, True, True)
+        chunk_size = self.config["group_chunk_size"]
 
-        # Decompress the result
-        nrn_groups = self.decompress(compressed)
+        started_groups = set()
 
-        return nrn_groups
+        while True:
+            chunk = self.decompress(self.client.get_group_chunk(stream_id, chunk_size))
 
-    def import_groups_from_neuron(self, group_list):
+            if len(chunk) == 0:
+                break
+
+            self.apply_group_chunk(chunk, started_groups)
+
+    def import_groups_from_neuron_async(self, group_list, on_done=None):
+        """
+        Like import_groups_from_neuron(), but does not block while NEURON prepares the data. The chunks
+        of roots are applied as they arrive, when poll_futures() is called (e.g. by the modal timer).
+
+        :param on_done: Called without arguments after the last chunk is applied
+        """
+        blender_groups = self.get_group_dicts(group_list)
+        chunk_size = self.config["group_chunk_size"]
+
+        started_groups = set()
+
+        def request_chunk(stream_id):
+            self.call_async(
+                ["get_group_chunk", [stream_id, chunk_size]],
+                on_done=lambda compressed: on_chunk(stream_id, compressed)
+            )
+
+        def on_chunk(stream_id, compressed):
+            chunk = self.decompress(compressed)
 
-        nrn_groups = self.get_group_data_from_neuron(group_list)
+            if len(chunk) == 0:
+                if on_done is not None:
+                    on_done()
 
-        # Update each blender node group with the data received from NRN
-        for nrn_group in nrn_groups:
+                return
+
+            self.apply_group_chunk(chunk, started_groups)
+
+            request_chunk(stream_id)
+
+        self.call_async(["initialize_groups", [blender_groups, True, True]], on_done=request_chunk)
+
+    def apply_group_chunk(self, chunk, started_groups):
+        """
+        Updates each blender node group with the roots received from NRN
+
+        :param chunk: A decompressed list of partial group dicts (see NeuronNode.get_group_chunk())
+        :param started_groups: Names of the groups whose first chunk has been applied. Updated in place.
+        """
+        for nrn_group in chunk:
             node_group = self.groups[nrn_group["name"]]
+            is_first_chunk = node_group.name not in started_groups
 
-            print('Importing group: ' + node_group.name + ' from NEURON...')
+            if is_first_chunk:
+                print('Importing group: ' + node_group.name + ' from NEURON...')
+                started_groups.add(node_group.name)
 
-            # Remove any views of the cells
-            if node_group.view is not None:
-                node_group.view.remove()
-                node_group.view = None
+                # Remove any views of the cells
+                if node_group.view is not None:
+                    node_group.view.remove()
+                    node_group.view = None
 
-            # Update blender node group with the data received from NRN
-            node_group.from_full_NEURON_group(nrn_group)
+            node_group.from_NEURON_group_chunk(nrn_group, is_first_chunk)
 
     def get_selected_groups(self):
         return [group for group in self.groups.values() if group.selected]
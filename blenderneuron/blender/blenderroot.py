@@ -3,9 +3,11 @@ from blenderneuron.section import Section
 import numpy as np
 import math
 import numpy as np
+from collections import OrderedDict
 
 
 class BlenderSection(Section):
+    __slots__ = ("was_split", "split_sections", "_parent_node")
 
     def __init__(self):
         super(BlenderSection, self).__init__()
@@ -33,9 +35,7 @@ class BlenderSection(Section):
                 # Pre-processing: set attributes from the dictionary
                 current_node.name = current_dict["name"]
                 current_node.nseg = current_dict["nseg"]
-                current_node.point_count = current_dict["point_count"]
-                current_node.coords = current_dict["coords"]
-                current_node.radii = current_dict["radii"]
+                current_node.set_coords_and_radii(current_dict["coords"], current_dict["radii"])
                 current_node.parent_connection_loc = current_dict["parent_connection_loc"]
                 current_node.connection_end = current_dict["connection_end"]
 
@@ -74,6 +74,30 @@ class BlenderSection(Section):
                     # Clean up temporary attributes
                     del current_node._parent_node
 
+    def activity_from_NEURON_section_dict(self, nrn_section_dict):
+        """
+        Iteratively sets the activity of the section tree from NEURON section dictionaries whose tree matches it,
+        e.g. after the tree was built from a flat geometry block (see sections_from_network_geometry()).
+
+        :param nrn_section_dict: The dictionary containing NEURON section data.
+        :return: None
+        """
+        stack = [(self, nrn_section_dict)]
+
+        while stack:
+            node, section_dict = stack.pop()
+
+            if "activity" in section_dict:
+                node.activity.from_dict(section_dict["activity"])
+
+            if "segment_activity" in section_dict:
+                node.segment_activity = {
+                    int(k): Activity().from_dict(v)
+                    for k, v in section_dict["segment_activity"].items()
+                }
+
+            stack.extend(zip(node.children, section_dict["children"]))
+
     def make_split_sections(self, max_length):
         """
         Splits a section into smaller chained sub-sections if the arc length of the points
@@ -100,8 +124,8 @@ class BlenderSection(Section):
         # Create new sections
         self.split_sections = [BlenderSection() for i in range(num_sections)]
 
-        old_coords = np.array(self.coords).reshape((-1, 3))
-        old_radii = np.array(self.radii)
+        old_coords = self.coords.reshape((-1, 3))
+        old_radii = self.radii
 
         # Split the coords and radii
         split_length = 0
@@ -115,7 +139,7 @@ class BlenderSection(Section):
             # Start a 2nd+ split section with the most recent point
             if split_sec_i > 0:
                 prev_sec = self.split_sections[split_sec_i-1]
-                split_sec_coords.append(prev_sec.coords[-1])
+                split_sec_coords.append(prev_sec.coords[-3:])
                 split_sec_radii.append(prev_sec.radii[-1])
 
             exact_length_match = False
@@ -148,9 +172,7 @@ class BlenderSection(Section):
                 split_sec_coords.append(virtual_coord)
                 split_sec_radii.append(virtual_radius)
 
-            split_sec.coords = np.array(split_sec_coords)
-            split_sec.radii = np.array(split_sec_radii)
-            split_sec.point_count = len(split_sec.radii)
+            split_sec.set_coords_and_radii(split_sec_coords, split_sec_radii)
             split_sec.name = self.name + "["+str(split_sec_i)+"]"
 
         return self.split_sections
@@ -163,7 +185,7 @@ class BlenderSection(Section):
         prev_coord, prev_radius = None, None
         coords, radii = [], []
         for split_i, split_sec in enumerate(self.split_sections):
-            for coord_i, coord in enumerate(np.reshape(split_sec.coords, (-1, 3))):
+            for coord_i, coord in enumerate(split_sec.coords.reshape((-1, 3))):
                 radius = split_sec.radii[coord_i]
 
                 # Skip if identical to previous point
@@ -178,12 +200,10 @@ class BlenderSection(Section):
                 prev_coord = coord
                 prev_radius = radius
 
-        self.coords = np.array(coords).reshape(-1)
-        self.radii = np.array(radii).reshape(-1)
-        self.point_count = len(self.radii)
+        self.set_coords_and_radii(coords, radii)
 
     def arc_lengths(self):
-        coords = np.array(self.coords).reshape(-1, 3)
+        coords = self.coords.reshape(-1, 3)
         start = coords[0:-1]
         end = coords[1:]
         diff = end - start
@@ -194,7 +214,7 @@ class BlenderSection(Section):
         return tot_len
 
     def dist_to_closest_coord(self, target):
-        coords = np.array(self.coords).reshape(-1, 3)
+        coords = self.coords.reshape(-1, 3)
         target = np.array(target).reshape((1, 3))
 
         diff = coords - target
@@ -230,7 +250,60 @@ class BlenderSection(Section):
                 self.was_split = False
 
 
+def sections_from_network_geometry(geometry, roots=None):
+    """
+    Builds section trees from the flat layout returned by NeuronNode.get_network_geometry(). The coords and
+    radii of each section are views of the contiguous geometry arrays (they are not copied).
+
+    :param geometry: The decompressed geometry dict
+    :param roots: Optional {name: BlenderSection} of existing root sections to fill in (e.g. from the node's
+        root index). Other roots are created.
+    :return: An OrderedDict of {root name: root BlenderSection}
+    """
+    names = geometry["names"]
+    parents = geometry["parent_indices"]
+    offsets = geometry["point_offsets"]
+    counts = geometry["point_counts"]
+    coords = geometry["coords"]
+    radii = geometry["radii"]
+    connection_locs = geometry["parent_connection_locs"]
+    connection_ends = geometry["connection_ends"]
+    nsegs = geometry["nseg"]
+
+    sections = [None] * len(names)
+    result = OrderedDict()
+
+    for i, name in enumerate(names):
+        parent_i = parents[i]
+
+        if parent_i < 0 and roots is not None and name in roots:
+            section = roots[name]
+            section.children = []
+        else:
+            section = BlenderSection()
+
+        start, end = offsets[i], offsets[i] + counts[i]
+
+        section.name = name
+        section.nseg = int(nsegs[i])
+        section.set_coords_and_radii(coords[start * 3:end * 3], radii[start:end])
+        section.connection_end = float(connection_ends[i])
+
+        # Sections are listed parents-first, so the parent already exists
+        if parent_i < 0:
+            section.parent_connection_loc = None
+            result[name] = section
+        else:
+            section.parent_connection_loc = float(connection_locs[i])
+            sections[parent_i].children.append(section)
+
+        sections[i] = section
+
+    return result
+
+
 class BlenderRoot(BlenderSection):
+    __slots__ = ("index", "group")
 
     def __init__(self, index, name, group=None):
         super(BlenderRoot, self).__init__()
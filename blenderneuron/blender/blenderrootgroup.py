@@ -2,6 +2,7 @@ from blenderneuron.blender.views.cellobjectview import CellObjectView
 from blenderneuron.blender.views.sectionobjectview import SectionObjectView
 from blenderneuron.blender.views.jsonview import JsonView
 from blenderneuron.blender.utils import remove_prop_collection_item, COLOR_RAMP_NAME
+from blenderneuron.blender.blenderroot import sections_from_network_geometry
 from blenderneuron.rootgroup import *
 from blenderneuron.blender.views.vectorconfinerview import VectorConfinerView
 import bpy
@@ -42,7 +43,6 @@ class BlenderRootGroup(RootGroup):
         self.animate_color = True
         self.animation_range_low = -85
         self.animation_range_high = 20
-        self.simplification_epsilon = 0.1
         self.frames_per_ms = 1
 
         self.state = 'new'
@@ -78,74 +78,59 @@ class BlenderRootGroup(RootGroup):
         self.node.ui_properties.groups_index = self.ui_group.index
 
     def from_full_NEURON_group(self, nrn_group):
+        self.from_NEURON_group_chunk(nrn_group, is_first_chunk=True)
 
-        # Update each group root with the NRN root
-        for nrn_root in nrn_group["roots"]:
+    def from_NEURON_group_chunk(self, nrn_group, is_first_chunk):
+        """
+        Updates the group with a batch of roots received from NEURON (see NeuronNode.get_group_chunk)
 
-            name = nrn_root["name"]
+        :param nrn_group: A group dict with a subset of the group roots. The first chunk of a group
+            also contains the group-level data (e.g. activity times).
+        :param is_first_chunk: Whether this is the first chunk received for the group
+        :return: None
+        """
+        if is_first_chunk:
+            if "activity" in nrn_group:
+                self.activity.from_dict(nrn_group["activity"])
 
-            if name not in self.roots:
+            else:
+                self.clear_activity()
+
+            self.state = 'imported'
+
+        roots = []
+
+        for nrn_root in nrn_group["roots"]:
+            if nrn_root["name"] not in self.roots:
                 bpy.ops.blenderneuron.get_cell_list_from_neuron()
 
-            self.roots[name].from_full_NEURON_section_dict(nrn_root)
+            roots.append(self.roots[nrn_root["name"]])
 
-        if "activity" in nrn_group:
-            self.activity.from_dict(nrn_group["activity"])
+        # The 3D points of the roots arrive in one flat block, which fills in the section trees
+        geometry = nrn_group.get("geometry")
 
-            # Set activity times from the group time
-            for root in self.roots.values():
-                self.set_activity_times(root, self.activity.times)
-                self.simplify_activity(root)
-                
-        else:
-            self.clear_activity()
-            
-        self.state = 'imported'
+        if geometry is not None:
+            sections_from_network_geometry(geometry, {
+                nrn_root["name"]: root for root, nrn_root in zip(roots, nrn_group["roots"])
+            })
 
-    def set_activity_times(self, root, times):
-        """
-        Iteratively sets the activity times for each node starting from the root node.
+        # Update each group root with the NRN root
+        for root, nrn_root in zip(roots, nrn_group["roots"]):
+            if geometry is not None:
+                root.activity_from_NEURON_section_dict(nrn_root)
 
-        :param root: The root node whose activity times need to be set.
-        :param times: The times to set for the activity.
-        :return: None
-        """
-        # Initialize a stack with the root node
-        stack = [root]
-
-        while stack:
-            node = stack.pop()
-            # Set the activity times for the current node
-            node.activity.times = times
-            for act in node.segment_activity.values():
-                act.times = times
-
-            # Add child nodes to the stack to process them iteratively
-            if node.children:
-                # Reverse the children to maintain traversal order
-                stack.extend(reversed(node.children))
-
-    def simplify_activity(self, root):
-        """
-        Iteratively simplifies the activity of each node starting from the root node.
+            # Older NEURON nodes send the points in nested section dicts
+            else:
+                root.from_full_NEURON_section_dict(nrn_root)
 
-        :param root: The root node whose activity needs to be simplified.
-        :return: None
-        """
-        # Initialize a stack with the root node
-        stack = [root]
-
-        while stack:
-            node = stack.pop()
-            # Simplify the activity of the current node
-            node.activity.simplify(self.simplification_epsilon)
-            for act in node.segment_activity.values():
-                act.simplify(self.simplification_epsilon)
-
-            # Add child nodes to the stack to process them iteratively
-            if node.children:
-                # Reverse the children to maintain traversal order
-                stack.extend(reversed(node.children))
+            if self.record_activity:
+                # Set activity times from the group time
+                self.set_activity_times(root, self.activity.times)
+
+        # Simplify the traces of all the roots in the chunk together. Traces that NEURON already simplified
+        # are skipped.
+        if self.record_activity:
+            self.simplify_activity(roots)
 
     def import_group(self):
         self.node.import_groups_from_neuron([self])
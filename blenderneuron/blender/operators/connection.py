@@ -55,6 +55,10 @@ class NodeStartOpearator(bpy.types.Operator, BlenderNodeClass):
                 if self.node is not None:
                     self.node.work_on_queue_tasks()
 
+                    # Apply the results of any finished asynchronous calls to NEURON
+                    if self.node.client is not None:
+                        self.node.poll_futures()
+
             finally:
                 self.servicing = False
 
@@ -1,5 +1,6 @@
 import bpy
 from bpy.types import (Operator)
+from bpy.props import BoolProperty
 from bpy_extras.io_utils import ExportHelper
 import numpy as np
 
@@ -132,7 +133,15 @@ class SimulationSettingsToNeuronOperator(Operator, CellGroupOperatorAbstract):
     bl_description = "Sends simulation parameters set in Blender to NEURON"
 
     def execute(self, context):
-        self.node.ui_properties.simulator_settings.to_neuron()
+        settings = self.node.ui_properties.simulator_settings
+
+        # Send the params and read back the values NEURON applied in one round trip
+        with self.node.batch() as batch:
+            batch.call("set_sim_params", settings.get_sim_params())
+            params_i = batch.call("get_sim_params")
+
+        settings.from_neuron(batch.results[params_i])
+
         return{'FINISHED'}
 
 
@@ -175,11 +184,28 @@ class InitAndRunNeuronOperator(Operator, CellGroupOperatorAbstract):
     bl_label = "Init & Run NEURON"
     bl_description = "Initializes and runs the NEURON simulation (i.e. `h.run()`)"
 
+    asynchronous: BoolProperty(
+        default=False,
+        description="Return without waiting for the simulation to finish. The simulation parameters "
+                    "are updated once it does."
+    )
+
     def execute(self, context):
-        self.client.run_command("h.run()")
+        if self.asynchronous:
+            settings = self.node.ui_properties.simulator_settings
+
+            # Queued calls run in order, so the params are read after the run
+            self.node.call_async("h.run()")
+            self.node.call_async(["get_sim_params", []], on_done=lambda params: settings.from_neuron(params))
 
-        # Update the current time
-        bpy.ops.blenderneuron.sim_settings_from_neuron()
+            return{'FINISHED'}
+
+        # Run and get the updated current time in one round trip
+        with self.node.batch() as batch:
+            batch.run_command("h.run()")
+            params_i = batch.call("get_sim_params")
+
+        self.node.ui_properties.simulator_settings.from_neuron(batch.results[params_i])
 
         return{'FINISHED'}
 
@@ -203,10 +229,24 @@ class ImportGroupsOperator(Operator, CellGroupOperatorAbstract):
     bl_label = "Import Group Data"
     bl_description = "Imports cell group data (e.g. morphology and activity) from NEURON into Blender"
 
+    asynchronous: BoolProperty(
+        default=False,
+        description="Return without waiting for NEURON. The groups are displayed once all of their data "
+                    "has been imported."
+    )
+
     def execute(self, context):
 
         selected_groups = self.node.get_selected_groups()
 
+        if self.asynchronous:
+            self.node.import_groups_from_neuron_async(
+                selected_groups,
+                on_done=lambda: bpy.ops.blenderneuron.display_groups()
+            )
+
+            return{'FINISHED'}
+
         self.node.import_groups_from_neuron(selected_groups)
 
         bpy.ops.blenderneuron.display_groups()
@@ -264,6 +304,7 @@ class ExportGroupsOperator(Operator, CellGroupOperatorAbstract):
                           for group in self.node.groups.values()
                           if group.selected]
 
+        # All selected groups are sent in one call, so there is nothing further to coalesce
         self.client.update_groups(blender_groups)
 
         return{'FINISHED'}
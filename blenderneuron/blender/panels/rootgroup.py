@@ -115,8 +115,9 @@ class ImportPanel(AbstractBlenderNEURONPanel, Panel):
     def draw(self, context):
         scene = context.scene
 
+        # Keep the UI responsive during large imports
         self.layout.operator("blenderneuron.import_groups", text="Import Cell Groups to Blender",
-                             icon="FORWARD")
+                             icon="FORWARD").asynchronous = True
 
         self.layout.operator("blenderneuron.display_groups", text="Show Imported Groups",
                              icon="RESTRICT_VIEW_OFF")
@@ -215,6 +216,14 @@ class GroupSettingsPanel(AbstractBlenderNEURONPanel, Panel):
             row.label(text='Sampling Period:')
             row.prop(group, "recording_period", text="")
 
+            row = col.split(factor=0.5)
+            row.label(text='Keep Last (ms):')
+            row.prop(group, "recording_window", text="")
+
+            row = col.split(factor=0.5)
+            row.label(text='Value Precision:')
+            row.prop(group, "activity_quantization", text="")
+
             row = col.split(factor=0.5)
             row.label(text='Frames per Millisecond:')
             row.prop(group, "frames_per_ms", text="")
@@ -223,6 +232,14 @@ class GroupSettingsPanel(AbstractBlenderNEURONPanel, Panel):
             row.label(text='Simplification Tolerance:')
             row.prop(group, "simplification_epsilon", text="")
 
+            row = col.split(factor=0.5)
+            row.label(text='Simplify in NEURON:')
+            row.prop(group, "simplify_in_neuron", text="")
+
+            row = col.split(factor=0.5)
+            row.label(text='Simplification Processes:')
+            row.prop(group, "simplification_workers", text="")
+
 
             row = col.split(factor=0.5)
             row.label(text='Animate Brightness:')
@@ -480,7 +497,7 @@ class SimulationSettingsPanel(AbstractBlenderNEURONPanel, Panel):
             col.prop(settings, "abs_tolerance", text="Absolute tolerance")
 
         col.separator()
-        col.operator("blenderneuron.init_and_run_neuron", text="Init & Run", icon="ARMATURE_DATA")
+        col.operator("blenderneuron.init_and_run_neuron", text="Init & Run", icon="ARMATURE_DATA").asynchronous = True
         col.separator()
         col.prop(context.scene.BlenderNEURON_properties, "neuron_last_command")
         col.separator()
@@ -1,6 +1,7 @@
 import bpy, random, numpy
 
 from blenderneuron import COLOR_RAMP_NAME
+from blenderneuron.activity import QUANTIZATIONS
 from blenderneuron.blender.views.synapseformerview import SynapseFormerView
 from blenderneuron.blender import BlenderNodeClass
 
@@ -434,6 +435,15 @@ class RootGroupProperties(PropertyGroup, BlenderNodeClass):
         description="How often to collect the recording variable during simulation (ms)"
     )
 
+    recording_window: FloatProperty(
+        default=0,
+        min=0,
+        get=get_prop("recording_window"),
+        set=set_prop("recording_window"),
+        description="Only keeps the activity recorded during the last amount of simulation time (ms). "
+                    "0 will keep all recorded activity"
+    )
+
     record_variable: StringProperty(
         default="v",
         get=get_prop("record_variable"),
@@ -485,6 +495,24 @@ class RootGroupProperties(PropertyGroup, BlenderNodeClass):
                     " only completely co-linear activity points (e.g. lossless)"
     )
 
+    simplify_in_neuron: BoolProperty(
+        default=False,
+        get=get_prop("simplify_in_neuron"),
+        set=set_prop("simplify_in_neuron"),
+        description="Whether to simplify the recorded activity in NEURON, before it is sent to Blender. "
+                    "Only the kept points are transferred, which speeds up the import of long recordings"
+    )
+
+    simplification_workers: IntProperty(
+        default=1,
+        min=0,
+        get=get_prop("simplification_workers"),
+        set=set_prop("simplification_workers"),
+        description="The number of processes used to simplify the recorded activity of groups with many traces. "
+                    "1 simplifies in Blender's process. 0 uses all CPU cores. Extra processes are started "
+                    "(forked or spawned) from Blender"
+    )
+
     frames_per_ms: FloatProperty(
         default=1,
         min=0,
@@ -531,6 +559,27 @@ class RootGroupProperties(PropertyGroup, BlenderNodeClass):
         set=set_gran_prop("recording_granularity")
     )
 
+    def get_quantization(self):
+        return QUANTIZATIONS.index(self.node_group.activity_quantization)
+
+    def set_quantization(self, value):
+        self.node_group.activity_quantization = QUANTIZATIONS[value]
+
+    activity_quantization: bpy.props.EnumProperty(
+        items=[
+            ('significant', '4 Digits', 'Values are rounded to 4 significant digits', 0),
+            ('float16', 'Half Float', 'Values are sent as 16 bit floats (about 3 significant digits)', 1),
+            ('fixed', 'Fixed Point', 'The range of the values is divided into 65536 levels. '
+                                     'Smallest transfers', 2),
+        ],
+        name="Value precision",
+        description="How recorded values are rounded before they are sent from NEURON. Lower precision "
+                    "transfers faster",
+        default='significant',
+        get=get_quantization,
+        set=set_quantization
+    )
+
     '''
     ('Group', 'Cell Group', 'Coarsest. The group of selected cells is represented as '
                             'one object in Blender', 3),
@@ -623,8 +672,12 @@ class RootGroupProperties(PropertyGroup, BlenderNodeClass):
         self.recording_period = source_group.recording_period
         self.recording_time_start = source_group.recording_time_start
         self.recording_time_end = source_group.recording_time_end
+        self.recording_window = source_group.recording_window
+        self.activity_quantization = source_group.activity_quantization
         self.frames_per_ms = source_group.frames_per_ms
         self.simplification_epsilon = source_group.simplification_epsilon
+        self.simplify_in_neuron = source_group.simplify_in_neuron
+        self.simplification_workers = source_group.simplification_workers
         self.animate_brightness = source_group.animate_brightness
         self.animate_color = source_group.animate_color
         self.animation_range_low = source_group.animation_range_low
@@ -635,31 +688,56 @@ class RootGroupProperties(PropertyGroup, BlenderNodeClass):
 
 
 
+# True while from_neuron() sets the properties, whose update callbacks would send them back one by one
+_receiving_sim_params = False
+
+
 class SimulatorSettings(BlenderNodeClass, PropertyGroup):
 
-    def to_neuron(self, context=None):
-        self.client.set_sim_params({
+    def get_sim_params(self):
+        """
+        :return: The simulation parameters, as expected by NeuronNode.set_sim_params()
+        """
+        return {
             "tstop": self.neuron_tstop,
             "dt": self.time_step,
             "atol": self.abs_tolerance,
             "celsius": self.temperature,
             "cvode": self.integration_method,
-        })
+        }
 
-    def from_neuron(self):
-        client = self.client
-
-        if client is None:
+    def to_neuron(self, context=None):
+        if _receiving_sim_params:
             return
 
-        params = client.get_sim_params()
+        self.client.set_sim_params(self.get_sim_params())
 
-        self.neuron_t = params["t"]
-        self.neuron_tstop = params["tstop"]
-        self.time_step = params["dt"]
-        self.abs_tolerance = params["atol"]
-        self.temperature = params["celsius"]
-        self.integration_method = str(int(float(params["cvode"])))
+    def from_neuron(self, params=None):
+        """
+        :param params: Simulation parameters already fetched from NEURON. If None, they are fetched.
+        """
+        global _receiving_sim_params
+
+        if params is None:
+            client = self.client
+
+            if client is None:
+                return
+
+            params = client.get_sim_params()
+
+        _receiving_sim_params = True
+
+        try:
+            self.neuron_t = params["t"]
+            self.neuron_tstop = params["tstop"]
+            self.time_step = params["dt"]
+            self.abs_tolerance = params["atol"]
+            self.temperature = params["celsius"]
+            self.integration_method = str(int(float(params["cvode"])))
+
+        finally:
+            _receiving_sim_params = False
 
     neuron_t: FloatProperty(
         description="The current simulation time (e.g. h.t) in ms"
@@ -7,6 +7,7 @@ import shlex
 import subprocess
 import bpy
 import numpy as np
+from blenderneuron.activity import line_dists, rdp, rdp_indices
 
 COLOR_RAMP_NAME = "ColorRamp" if bpy.app.version[0] < 4 else "Color Ramp"
 
@@ -221,62 +222,6 @@ def fast_get(coll, prop_name, sub_items_per_item=1):
         result.shape = (-1, sub_items_per_item)
     return result
 
-# Line simplification algorithm using Numpy from:
-# https://github.com/fhirschmann/rdp/issues/7
-
-def line_dists(points, start, end):
-    if np.all(start == end):
-        return np.linalg.norm(points - start, axis=1)
-
-    vec = end - start
-    cross = np.cross(vec, start - points)
-    return np.divide(abs(cross), np.linalg.norm(vec))
-
-
-def rdp(M, epsilon=0):
-    """
-    Line simplification algorithm using the Ramer-Douglas-Peucker algorithm.
-    This is the iterative version to avoid recursion.
-
-    :param M: Array of points [[x1, y1], [x2, y2], ...]
-    :param epsilon: Tolerance value for simplification
-    :return: Simplified array of points
-    """
-    M = np.array(M)
-    stack = [(0, len(M) - 1)]
-    indices = [0, len(M) - 1]
-
-    while stack:
-        start_idx, end_idx = stack.pop()
-        start = M[start_idx]
-        end = M[end_idx]
-
-        if end_idx - start_idx <= 1:
-            continue
-
-        segment = M[start_idx + 1:end_idx]
-        if len(segment) == 0:
-            continue
-
-        dists = line_dists(segment, start, end)
-        index = np.argmax(dists)
-        dmax = dists[index]
-
-        if dmax > epsilon:
-            # Index of the point with the maximum distance in the original array
-            actual_index = index + start_idx + 1
-            indices.append(actual_index)
-            # Add the two new segments to the stack
-            stack.append((start_idx, actual_index))
-            stack.append((actual_index, end_idx))
-
-    # Sort the indices and construct the result
-    indices.sort()
-    result = M[indices]
-    return result
-
-# End line simplification
-
 
 # From: https://stackoverflow.com/a/43553331
 def make_safe_filename(s):
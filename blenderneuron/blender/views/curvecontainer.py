@@ -251,8 +251,7 @@ class CurveContainer:
                         section_coords.append(seg_coords[3:6])
                         section_radii.append(seg_radii[1])
 
-            current_root.coords = section_coords
-            current_root.radii = section_radii
+            current_root.set_coords_and_radii(section_coords, section_radii)
 
             if recursive:
                 # Add child sections to the stack to process them iteratively
@@ -287,9 +286,9 @@ class CurveContainer:
         # Get radii
         radii = np.zeros(num_coords)
         spline.bezier_points.foreach_get("radius", radii)
-        radii = (radii[1:-1] if self.closed_ends else radii).tolist()
+        radii = radii[1:-1] if self.closed_ends else radii
 
-        return coords.tolist(), radii
+        return coords, radii
 
     def add_section(self, root, recursive=True, in_top_level=True, origin_type="center"):
         """
@@ -309,8 +308,8 @@ class CurveContainer:
             current_node, current_in_top_level = stack.pop()
 
             # Reshape the coords to be n X 3 array (for xyz)
-            coords = np.array(current_node.coords)
-            coords.shape = (-1, 3)
+            # Imported coords are already arrays (e.g. mapped from a shared payload), so this does not copy them
+            coords = np.asarray(current_node.coords).reshape(-1, 3)
 
             if current_in_top_level:
                 self.set_origin(coords, origin_type)
@@ -1,7 +1,9 @@
 import ast
 import zlib
 
-from blenderneuron.utils import deserialize, serialize
+from blenderneuron.utils import deserialize, serialize, pack, unpack, numpy_available, WIRE_FORMAT_MAGIC, \
+    ReadWriteLock
+from blenderneuron import compression
 
 try:
     import Queue as queue
@@ -9,7 +11,7 @@ except:
     import queue
 
 import threading, time, sys
-import os, json, traceback, socket, tempfile, atexit
+import os, json, traceback, socket, tempfile, atexit, mmap
 from contextlib import closing
 
 try:
@@ -30,9 +32,216 @@ except:                                                         # pragma: no cov
     from SocketServer import ThreadingMixIn                     # pragma: no cover
 
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 debug = False
 
+
+class TaskFuture(object):
+    """
+    A handle of a task enqueued on the other node. Use poll() (or the node's poll_futures()) to check for
+    completion without blocking, or result() to wait for it.
+    """
+
+    # Max seconds of each wait_for_tasks() request while waiting for the result
+    wait_timeout = 10
+
+    def __init__(self, client, task_id, on_done=None, on_error=None):
+        """
+        :param on_done: Called with the task result when the task succeeds
+        :param on_error: Called with the error traceback when the task fails. If None, the error is printed.
+        """
+        self.client = client
+        self.task_id = task_id
+        self.on_done = on_done
+        self.on_error = on_error
+
+        self.status = "QUEUED"
+        self.error = None
+        self._result = None
+
+    def done(self):
+        return self.status != "QUEUED"
+
+    def poll(self, status=None):
+        """
+        Checks the task status once, and fetches the result or error when it has finished
+
+        :param status: The task status, if already known (e.g. from wait_for_tasks)
+        :return: True if the task has finished
+        """
+        if self.done():
+            return True
+
+        if status is None:
+            status = self.client.get_task_status(self.task_id)
+
+        if status == "QUEUED":
+            return False
+
+        if status == "SUCCESS":
+            self._result = self.client.get_task_result(self.task_id)
+
+        elif status == "ERROR":
+            self.error = self.client.get_task_error(self.task_id)
+
+        else:
+            status = "ERROR"
+            self.error = "Task " + str(self.task_id) + " no longer exists on the other node"
+
+        self.status = status
+
+        if status == "SUCCESS":
+            if self.on_done is not None:
+                self.on_done(self._result)
+
+        elif self.on_error is not None:
+            self.on_error(self.error)
+
+        else:
+            print(self.error)
+
+        return True
+
+    def result(self):
+        """
+        Waits for the task to finish
+
+        :return: The task result. Raises an exception if the task failed.
+        """
+        # Block on the other node until the task finishes, instead of polling its status
+        while not self.poll(self.client.wait_for_tasks([self.task_id], self.wait_timeout)[0]):
+            pass
+
+        if self.status == "ERROR":
+            raise Exception(self.error)
+
+        return self._result
+
+
+class CommandBatch(object):
+    """
+    Collects commands and server function calls for a node client, and sends them to the other node in
+    a single run_batch() round trip. The calls are executed in order. Use as:
+
+        with node.batch() as batch:
+            batch.run_command("h.run()")
+            params_i = batch.call("get_sim_params")
+
+        params = batch.results[params_i]
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+
+    def run_command(self, command_string):
+        """
+        :return: The index of the command result in self.results
+        """
+        self.calls.append(command_string)
+        return len(self.calls) - 1
+
+    def call(self, function_name, *params):
+        """
+        :return: The index of the function result in self.results
+        """
+        self.calls.append([function_name, list(params)])
+        return len(self.calls) - 1
+
+    def execute(self):
+        calls, self.calls = self.calls, []
+        self.results = []
+
+        if len(calls) == 0:
+            return self.results
+
+        for outcome in self.client.run_batch(calls):
+            if outcome["status"] != "SUCCESS":
+                raise Exception(outcome["error"])
+
+            self.results.append(outcome["result"])
+
+        return self.results
+
+
+class PooledTransport(xmlrpclib.Transport, object):
+    """
+    An XML-RPC transport that keeps HTTP/1.1 connections alive between requests, instead of
+    connecting a new socket for each call. Each thread uses its own connection during a request.
+    Afterwards, the connection is returned to a pool of up to pool_size idle connections, which
+    are reused by later requests from any thread.
+    """
+
+    def __init__(self, pool_size=4, use_datetime=False, use_builtin_types=False):
+        self.pool_size = pool_size
+        self._idle = []  # [(host, connection)]
+        self._idle_lock = threading.Lock()
+        self._local = threading.local()
+
+        super(PooledTransport, self).__init__(use_datetime, use_builtin_types)
+
+    # The base Transport stores its single connection in _connection - make it per-thread
+    @property
+    def _connection(self):
+        return getattr(self._local, "connection", (None, None))
+
+    @_connection.setter
+    def _connection(self, value):
+        self._local.connection = value
+
+    def request(self, host, handler, request_body, verbose=False):
+        if self._connection[1] is None:
+            self._connection = self._take_idle(host)
+
+        try:
+            return super(PooledTransport, self).request(host, handler, request_body, verbose)
+
+        finally:
+            self._release()
+
+    def _take_idle(self, host):
+        with self._idle_lock:
+            for i, (idle_host, connection) in enumerate(self._idle):
+                if idle_host == host:
+                    return self._idle.pop(i)
+
+        return None, None
+
+    def _release(self):
+        host, connection = self._connection
+
+        # The base transport closes the connection on errors
+        if connection is None:
+            return
+
+        self._connection = (None, None)
+
+        with self._idle_lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append((host, connection))
+                return
+
+        connection.close()
+
+    def close(self):
+        super(PooledTransport, self).close()
+
+        with self._idle_lock:
+            idle, self._idle = self._idle, []
+
+        for host, connection in idle:
+            connection.close()
+
+
 class CommNode(object):
     server_types = {
         "NEURON": "Blender",
@@ -42,6 +251,18 @@ class CommNode(object):
         "Package": "Blender",
     }
 
+    # Max seconds the queue servicing thread blocks waiting for a task, before checking if it should stop
+    queue_wait_timeout = 0.1
+
+    # Max seconds a wait_for_tasks() request can block a server thread
+    max_task_wait = 30
+
+    # Payloads at least this large are passed through a shared memory file when both nodes are on the same host
+    shared_payload_min_bytes = 64 * 1024
+
+    # Tmpfs (RAM-backed) directory for shared payload files, when available
+    shared_payload_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
     def __init__(self, server_end, on_client_connected=None, on_server_setup=None, coverage=False):
 
         self.coverage = coverage
@@ -49,6 +270,16 @@ class CommNode(object):
         self.groups = OrderedDict()
         self.root_index = OrderedDict()
 
+        # Pending TaskFutures of calls made with call_async()
+        self.futures = []
+
+        # Runs shared (read-only) tasks concurrently, see register_function()
+        self.worker_pool = None
+
+        # Shared payload files written by this node, removed by the reader (or at exit if never read)
+        self.shared_payloads = set()
+        atexit.register(self.remove_shared_payloads)
+
         self.load_config()
 
         if server_end in self.server_types.keys():
@@ -102,12 +333,60 @@ class CommNode(object):
     def init_task_queue(self):
         self.queue = queue.Queue()
         self.task_lock = threading.Lock()
-        self.tasks = {}
+        self.task_finished = threading.Condition(self.task_lock)  # Notified when any task finishes
+        self.tasks = OrderedDict()  # Least recently accessed first
         self.task_next_id = 0
 
+        # Held while adding tasks to the queue, so that batches are enqueued without interleaving
+        self.enqueue_lock = threading.RLock()
+
+        # Shared tasks hold it for reading, all other tasks for writing
+        self.execution_lock = ReadWriteLock()
+
+        self.task_stats = {
+            "created": 0,
+            "evicted_on_fetch": 0,
+            "evicted_ttl": 0,
+            "evicted_lru": 0,
+        }
+
+    def init_command_cache(self):
+        self.command_cache = OrderedDict()  # Compiled commands, least recently used first
+        self.command_cache_lock = threading.Lock()
+        self.command_cache_stats = {
+            "hits": 0,
+            "misses": 0,
+        }
+
+        self.imports_loaded = False
+
+    def load_imports(self):
+        """
+        Runs this end's configured imports once, so that commands do not need to re-run them
+        """
+        exec(self.config["imports"][self.server_end], globals())
+        self.imports_loaded = True
+
     def setup_server(self):
 
         class ErrorHandler(SimpleXMLRPCRequestHandler):
+            # Keep connections open between requests (see PooledTransport)
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            # Seconds to keep an idle connection open
+            timeout = 60
+
+            def setup(self):
+                super(ErrorHandler, self).setup()
+
+                self.thread = threading.current_thread()
+                self.server.active_handlers.add(self)
+
+            def finish(self):
+                self.server.active_handlers.discard(self)
+                super(ErrorHandler, self).finish()
+
             def _dispatch(self, method, params):
                 try:
                     return self.server.funcs[method](*params)
@@ -123,6 +402,7 @@ class CommNode(object):
 
             def __init__(self, param):
                 self.daemon_threads = True
+                self.active_handlers = set()
                 super(CommNodeServer, self).__init__(
                     param,
                     requestHandler=ErrorHandler,
@@ -131,6 +411,12 @@ class CommNode(object):
                 )
 
         self.init_task_queue()
+        self.init_command_cache()
+
+        try:
+            self.load_imports()
+        except ImportError:
+            pass  # Retried before the first command runs
 
         port = self.config["default_port"][self.server_end]
 
@@ -141,19 +427,29 @@ class CommNode(object):
         self.server = CommNodeServer((self.server_ip, int(self.server_port)))
         self.server.register_introspection_functions()
 
+        # name: (function, shared) of functions added with register_function()
+        self.server_functions = {}
+
         # Basic server functions
         self.server.register_function(self.sm_stop, 'stop')
         self.server.register_function(self.sm_ping, 'ping')
+        self.server.register_function(compression.available_codecs, 'get_codecs')
+        self.server.register_function(self.sm_get_capabilities, 'get_capabilities')
         self.server.register_function(self.try_setup_client, 'try_setup_client')
 
         # Synchronous execution
         self.server.register_function(self.sm_run_command, 'run_command')
+        self.server.register_function(self.sm_run_batch, 'run_batch')
 
         # Asynchronous task execution queueing
         self.server.register_function(self.sm_enqueue_command, 'enqueue_command')
+        self.server.register_function(self.sm_enqueue_call, 'enqueue_call')
         self.server.register_function(self.sm_get_task_status, 'get_task_status')
+        self.server.register_function(self.sm_wait_for_tasks, 'wait_for_tasks')
         self.server.register_function(self.sm_get_task_error,  'get_task_error')
         self.server.register_function(self.sm_get_task_result, 'get_task_result')
+        self.server.register_function(self.sm_get_task_stats, 'get_task_stats')
+        self.server.register_function(self.sm_get_command_cache_stats, 'get_command_cache_stats')
 
         # Code coverage result saving
         self.server.register_function(self.sm_end_code_coverage, 'end_code_coverage')
@@ -163,6 +459,9 @@ class CommNode(object):
         self.server_thread.daemon = True
         self.server_thread.start()
 
+        pool_size = self.config["worker_pool_size"][self.server_end]
+        self.worker_pool = ThreadPoolExecutor(pool_size) if pool_size > 1 else None
+
         # Perform the servicing of queued tasks in a separate thread
         self.service_thread = threading.Thread(target=self.service_queue_loop)
         self.service_thread.daemon = True
@@ -182,12 +481,16 @@ class CommNode(object):
             self.service_thread_continue = False
             self.service_thread.join()
             self.service_thread = None
+
+            if self.worker_pool is not None:
+                self.worker_pool.shutdown(wait=True)
+                self.worker_pool = None
+
             self.init_task_queue()
 
         if hasattr(self, "server_thread") and self.server_thread is not None and self.server_thread.is_alive():
             try:
-                own_server_client = xmlrpclib.ServerProxy(self.server_address, allow_none=True)
-                own_server_client.stop()
+                self.sm_stop()
                 self.server_thread.join()
                 self.server_thread = None
             except:     # pragma: no cover
@@ -222,12 +525,31 @@ class CommNode(object):
                 client_address = self.read_client_address_file()
 
             # Create XML-RCP client and attempt to connect to it
-            self.client = xmlrpclib.ServerProxy(client_address, allow_none=True)
+            self.client = xmlrpclib.ServerProxy(
+                client_address,
+                transport=PooledTransport(self.config["client_pool_size"]),
+                allow_none=True
+            )
             assert self.client.ping() == 1
 
             # If connection succeeded, save the address
             self.client_address = client_address
 
+            # Codecs that the client can decode. Nodes without codec support only read plain zlib payloads
+            # of serialized text.
+            try:
+                self.client_codecs = self.client.get_codecs()
+                self.client_reads_wire_format = True
+            except xmlrpclib.Fault:
+                self.client_codecs = None
+                self.client_reads_wire_format = False
+
+            # Payload transfer methods that the client can read (see sm_get_capabilities)
+            try:
+                self.client_capabilities = self.client.get_capabilities()
+            except xmlrpclib.Fault:
+                self.client_capabilities = {}
+
         except (IOError, ValueError, AssertionError):
             if warn:
                 self.print_safe("Could not connect to " + self.client_end + " server. Ensure "+
@@ -236,6 +558,9 @@ class CommNode(object):
 
             self.client = None
             self.client_address = None
+            self.client_codecs = None
+            self.client_reads_wire_format = True
+            self.client_capabilities = {}
 
         if self.client is not None and self.on_client_connected is not None:
             self.on_client_connected(self)
@@ -302,19 +627,176 @@ class CommNode(object):
             self.server.shutdown()
             self.server.server_close()
 
+            # Close kept-alive connections, so their clients see the server as stopped
+            # If stopped by a client request, its connection is closed after the response is sent
+            for handler in list(self.server.active_handlers):
+                if handler.thread is threading.current_thread():
+                    handler.close_connection = True
+                    continue
+
+                try:
+                    handler.connection.shutdown(socket.SHUT_RDWR)
+                except OSError:  # pragma: no cover
+                    pass         # pragma: no cover
+
         return 0
 
     def sm_ping(self):
         self.print_safe(self.server_end + " server at " + self.server_address + " ALIVE")
         return 1
 
-    def sm_run_command(self, command_string):
+    def sm_get_capabilities(self):
+        """
+        :return: The payload features this node can read, so that peers only send payloads it understands
+        """
+        return {"shared_payload": True}
+
+    def sm_run_command(self, command_string, shared=False):
+        """
+        :param shared: True if the command only reads state, and can run concurrently with other shared tasks
+        """
         exec_lambda = self._get_command_lambda(command_string)
-        return self._run_lambda(exec_lambda)
+        return self._run_lambda(exec_lambda, shared)
 
-    def sm_enqueue_command(self, command_string):
+    def sm_enqueue_command(self, command_string, shared=False, depends_on=None):
+        """
+        :param depends_on: Ids of queued or finished tasks. The command is only run if they all succeed.
+        :return: The task id
+        """
         exec_lambda = self._get_command_lambda(command_string)
-        return self._enqueue_lambda(exec_lambda)
+        return self._enqueue_lambda(exec_lambda, shared, depends_on)
+
+    def sm_enqueue_call(self, function_name, params, depends_on=None):
+        """
+        Like enqueue_command, but the task calls a function registered on this node's server
+
+        :return: The task id
+        """
+        exec_lambda, shared = self._get_call_lambda([function_name, params])
+        return self._enqueue_lambda(exec_lambda, shared, depends_on)
+
+    def register_function(self, function, name=None, shared=False):
+        """
+        Registers a server function, which runs exclusively from other tasks, or concurrently with other
+        shared tasks if shared is True. When called directly, e.g. get_roots() while a queued h.run() task
+        is running, the call waits for the running exclusive task to finish.
+
+        :param function: The function to register
+        :param name: The name of the function on the server. Defaults to the function name.
+        :param shared: True if the function only reads state (e.g. get_sim_params)
+        """
+        if name is None:
+            name = function.__name__
+
+        self.server_functions[name] = (function, shared)
+
+        lock = self.execution_lock
+
+        def locked_function(*params):
+            with (lock.reading() if shared else lock.writing()):
+                return function(*params)
+
+        self.server.register_function(locked_function, name)
+
+    def call_async(self, call, on_done=None, on_error=None, depends_on=None):
+        """
+        Enqueues a call on the other node, without waiting for it to finish
+
+        :param call: A command string (see run_command) or a [function_name, [params]] pair
+        :param on_done: Called with the result, from poll_futures(), when the call succeeds
+        :param on_error: Called with the error, from poll_futures(), when the call fails
+        :param depends_on: TaskFutures of earlier calls. The call is skipped if any of them fails.
+        :return: A TaskFuture of the call
+        """
+        dependency_ids = [future.task_id for future in depends_on] if depends_on else None
+
+        if isinstance(call, (list, tuple)):
+            function_name, params = call
+            task_id = self.client.enqueue_call(function_name, list(params), dependency_ids)
+
+        else:
+            task_id = self.client.enqueue_command(call, False, dependency_ids)
+
+        future = TaskFuture(self.client, task_id, on_done, on_error)
+        self.futures.append(future)
+
+        return future
+
+    def poll_futures(self):
+        """
+        Checks the pending futures, and invokes the callbacks of the finished ones. Call this periodically
+        from the thread that should run the callbacks (e.g. Blender's modal timer).
+
+        :return: The number of futures still pending
+        """
+        pending = [future for future in self.futures if not future.done()]
+
+        if len(pending) > 0:
+            # Get all statuses in one request
+            statuses = self.client.wait_for_tasks([future.task_id for future in pending], 0, True)
+
+            for future, status in zip(pending, statuses):
+                future.poll(status)
+
+        # Callbacks may have added futures
+        self.futures = [future for future in self.futures if not future.done()]
+
+        return len(self.futures)
+
+    def sm_run_batch(self, calls):
+        """
+        Executes a list of calls in one round trip. The calls are enqueued together, and executed in order
+        by the queue servicing thread.
+
+        :param calls: A list where each entry is either a command string (see run_command) or a
+            [function_name, [params]] pair for a function registered on this node's server
+            (e.g. 'get_sim_params'). Functions that wait on the queue (e.g. 'run_command') cannot be batched.
+        :return: A list of {"status", "result", "error"} dicts, one for each call
+        """
+        lambdas = [self._get_call_lambda(call) for call in calls]
+
+        with self.enqueue_lock:
+            tasks = [self._enqueue_task(task_lambda, shared) for task_lambda, shared in lambdas]
+
+        outcomes = []
+
+        for task in tasks:
+            task["done"].wait()
+            self._on_task_fetched(task)
+
+            outcomes.append({
+                "status": task["status"],
+                "result": task["result"],
+                "error": task["error"],
+            })
+
+        return outcomes
+
+    def _get_call_lambda(self, call):
+        """
+        :return: A (lambda, shared) tuple of the task that runs the call
+        """
+        if not isinstance(call, (list, tuple)):
+            return self._get_command_lambda(call), False
+
+        function_name, params = call
+
+        if function_name in ("run_command", "run_batch"):
+            raise Exception("'" + function_name + "' waits on the task queue and cannot be batched")
+
+        # Queued tasks are run under the execution lock, so use the unlocked function
+        if function_name in self.server_functions:
+            function, shared = self.server_functions[function_name]
+        else:
+            function, shared = self.server.funcs[function_name], False
+
+        return (lambda: function(*params)), shared
+
+    def batch(self):
+        """
+        :return: A CommandBatch that sends its commands to the other node in one round trip
+        """
+        return CommandBatch(self.client)
 
     def sm_end_code_coverage(self):
         try:
@@ -343,9 +825,11 @@ class CommNode(object):
         """
         def exec_lambda():
 
-            end_imports = self.config["imports"][self.server_end]
             try:
-                exec(end_imports + "; " + command_string, globals())
+                if not self.imports_loaded:
+                    self.load_imports()
+
+                exec(self._get_compiled_command(command_string), globals())
             except SystemExit:
                 raise
             except:
@@ -359,35 +843,153 @@ class CommNode(object):
 
         return exec_lambda
 
-    def _run_lambda(self, task_lambda):
-        id = self._enqueue_lambda(task_lambda)
+    def _get_compiled_command(self, command_string):
+        """
+        Compiles a command string, reusing the code object of recently run identical commands
+        """
+        with self.command_cache_lock:
+            code = self.command_cache.get(command_string)
 
-        while self.sm_get_task_status(id) == 'QUEUED':
-            time.sleep(0.1)
+            if code is not None:
+                self.command_cache.move_to_end(command_string)
+                self.command_cache_stats["hits"] += 1
+                return code
 
-        status = self.sm_get_task_status(id)
+            self.command_cache_stats["misses"] += 1
 
-        if status == "SUCCESS":
-            return self.sm_get_task_result(id)
+        code = compile(command_string, "<" + self.server_end + " command>", "exec")
+
+        cache_size = self.config["command_cache_size"]
+
+        if cache_size > 0:
+            with self.command_cache_lock:
+                self.command_cache[command_string] = code
+
+                while len(self.command_cache) > cache_size:
+                    self.command_cache.popitem(last=False)
+
+        return code
+
+    def sm_get_command_cache_stats(self):
+        """
+        :return: Compiled command cache hit and miss counts, and the number of cached commands
+        """
+        with self.command_cache_lock:
+            stats = dict(self.command_cache_stats)
+            stats["size"] = len(self.command_cache)
+
+        return stats
+
+    def _run_lambda(self, task_lambda, shared=False):
+        # Keep a reference, the task can be evicted from the table once it completes
+        task = self._enqueue_task(task_lambda, shared)
+
+        # Block until the servicing thread completes the task
+        task["done"].wait()
+
+        self._on_task_fetched(task)
+
+        if task["status"] == "SUCCESS":
+            return task["result"]
 
         else:
-            raise Exception(self.sm_get_task_error(id))
+            raise Exception(task["error"])
+
+    def _enqueue_lambda(self, task_lambda, shared=False, depends_on=None):
+        return self._enqueue_task(task_lambda, shared, depends_on)["id"]
+
+    def _enqueue_task(self, task_lambda, shared=False, depends_on=None):
+        """
+        :param depends_on: Ids of tasks that must succeed for this task to run. If any of them fails,
+            this task is skipped, and its status is set to ERROR. Tasks that do not depend on a failed task
+            run regardless of it.
+        """
+        dependencies = []
+
+        if depends_on:
+            with self.task_lock:
+                for dependency_id in depends_on:
+                    if dependency_id not in self.tasks:
+                        raise Exception("Task " + str(dependency_id) + " does not exist. Enqueue dependent "
+                                        "tasks before fetching the results of their dependencies.")
+
+                    dependencies.append(self.tasks[dependency_id])
 
-    def _enqueue_lambda(self, task_lambda):
         task_id = self._get_new_task_id()
 
         task = {
             "id": task_id,
             "status": "QUEUED",
             "lambda": task_lambda,
+            "shared": shared,  # Whether it can run concurrently with other shared tasks
+            "depends_on": dependencies,
             "result": None,
-            "error": None
+            "error": None,
+            "done": threading.Event(),  # Set when the task is no longer QUEUED
+            "accessed": time.time(),
         }
 
-        self.tasks[task_id] = task
-        self.queue.put(task)
+        with self.task_lock:
+            self.tasks[task_id] = task
+            self.task_stats["created"] += 1
+            self._evict_tasks()
 
-        return task_id
+        with self.enqueue_lock:
+            self.queue.put(task)
+
+        return task
+
+    def _get_task(self, task_id):
+        """
+        Gets a task and marks it as the most recently accessed one
+        """
+        with self.task_lock:
+            task = self.tasks[task_id]
+            task["accessed"] = time.time()
+            self.tasks.move_to_end(task_id)
+
+        return task
+
+    def _on_task_fetched(self, task):
+        if task["status"] == "QUEUED" or not self.config["task_retention"]["evict_on_fetch"]:
+            return
+
+        with self.task_lock:
+            if self.tasks.pop(task["id"], None) is not None:
+                self.task_stats["evicted_on_fetch"] += 1
+
+    def _evict_tasks(self):
+        """
+        Removes completed tasks that were not accessed within the retention TTL, and the least recently
+        accessed completed tasks when there are more than the max number of tasks. Queued tasks are kept.
+        Must be called while holding the task_lock.
+        """
+        retention = self.config["task_retention"]
+        expired_before = time.time() - retention["ttl"]
+        excess = len(self.tasks) - retention["max_entries"]
+        skipped = 0
+
+        # Evict from the head (least recently accessed), without scanning the rest of the table
+        while skipped < len(self.tasks):
+            task = next(iter(self.tasks.values()))
+            expired = task["accessed"] < expired_before
+
+            if not expired and excess <= 0:
+                break
+
+            # Tasks are moved to the end when they finish, so their position is not needed until then
+            if task["status"] == "QUEUED":
+                self.tasks.move_to_end(task["id"])
+                skipped += 1
+                continue
+
+            self.tasks.popitem(last=False)
+            excess -= 1
+
+            if expired:
+                self.task_stats["evicted_ttl"] += 1
+            else:
+                self.task_stats["evicted_lru"] += 1
 
     def _get_new_task_id(self):
         with self.task_lock:
@@ -397,85 +999,301 @@ class CommNode(object):
         return task_id
 
     def sm_get_task_status(self, task_id):
-        if task_id in self.tasks:
-            return self.tasks[task_id]["status"]
+        with self.task_lock:
+            self._evict_tasks()
 
-        return "DOES_NOT_EXIST"
+        try:
+            return self._get_task(task_id)["status"]
+
+        except KeyError:
+            return "DOES_NOT_EXIST"
+
+    def sm_wait_for_tasks(self, task_ids, timeout=None, any_finished=False):
+        """
+        Blocks until the tasks finish, so that clients do not need to poll their statuses
+
+        :param task_ids: The ids of the tasks to wait for
+        :param timeout: Max seconds to wait (capped at max_task_wait). 0 returns the statuses immediately.
+        :param any_finished: If True, returns as soon as any of the tasks finishes
+        :return: The statuses of the tasks, in the order of task_ids. Unfinished tasks are 'QUEUED'.
+        """
+        if timeout is None or timeout > self.max_task_wait:
+            timeout = self.max_task_wait
+
+        with self.task_finished:
+            tasks = [self.tasks.get(task_id) for task_id in task_ids]
+            waiting = [task for task in tasks if task is not None]
+
+            def finished():
+                done = [task["status"] != "QUEUED" for task in waiting]
+                return any(done) if any_finished else all(done)
+
+            if len(waiting) > 0 and timeout > 0:
+                self.task_finished.wait_for(finished, timeout)
+
+            return [
+                "DOES_NOT_EXIST" if task is None else task["status"]
+                for task in tasks
+            ]
 
     def sm_get_task_error(self, task_id):
-        return self.tasks[task_id]["error"]
+        task = self._get_task(task_id)
+        self._on_task_fetched(task)
+        return task["error"]
 
     def sm_get_task_result(self, task_id):
-        return self.tasks[task_id]["result"]
+        task = self._get_task(task_id)
+        self._on_task_fetched(task)
+        return task["result"]
+
+    def sm_get_task_stats(self):
+        """
+        :return: Task table size and eviction counters, e.g. to monitor memory use of long-running nodes
+        """
+        with self.task_lock:
+            self._evict_tasks()
+
+            stats = dict(self.task_stats)
+            stats["size"] = len(self.tasks)
+            stats["queued"] = sum(1 for task in self.tasks.values() if task["status"] == "QUEUED")
+
+        return stats
+
+    def work_on_queue_tasks(self, first_task=None):
+        """
+        Runs the queued tasks until the queue is empty
 
-    def work_on_queue_tasks(self):
+        :param first_task: A task that was already taken off the queue, to run before the queued ones
+        :return: None
+        """
         q = self.queue
-        self.queue_error = False
+        task = first_task
 
-        while not q.empty():
+        while task is not None or not q.empty():
             self.print_safe("Tasks in queue. Getting next task...")
-            task = q.get()
 
-            try:
-                if not self.queue_error:
-                    self.print_safe("Running task...")
-                    result = task["lambda"]()
-                    task["result"] = result
-                    task["status"] = "SUCCESS"
-                else:
-                    self.print_safe("Previous task had an error. SKIPPING.")
-                    task["status"] = "ERROR"
+            if task is None:
+                task = q.get()
 
-            except:
-                self.queue_error = True
-                tb = traceback.format_exc()
+            # Shared tasks overlap with each other in the pool. Exclusive tasks wait for the running shared
+            # tasks to finish, and block the dispatch of later tasks while they run. The read lock is taken
+            # here, before dispatch, so that tasks take the lock in the order they were queued.
+            if task["shared"] and self.worker_pool is not None:
+                self.execution_lock.acquire_read()
 
-                if "SystemExit" not in tb:
-                    task["status"] = "ERROR"
-                    task["error"] = tb
-                    self.print_safe(tb)
+                try:
+                    self.worker_pool.submit(self._run_shared_task, task)
+                except:
+                    self.execution_lock.release_read()
+                    raise
 
-                else:
-                    task["status"] = "SUCCESS"
-                    task["result"] = None
+            else:
+                self._wait_for_dependencies(task)
 
-                    # We want to allow the RCP server to send back a response before killing the process
-                    def self_destruct():
-                        self.print_safe("Exiting NEURON in 1s ... ")
-                        time.sleep(0.5)
-                        quit()
+                with self.execution_lock.writing():
+                    self._run_task(task)
 
-                    thread = threading.Thread(target=self_destruct)
-                    thread.start()
+            task = None
 
             q.task_done()
             self.print_safe("DONE")
 
+    def _run_shared_task(self, task):
+        """
+        Runs a shared task in the worker pool, and releases the read lock taken when it was dispatched
+        """
+        try:
+            self._wait_for_dependencies(task)
+            self._run_task(task)
+
+        finally:
+            self.execution_lock.release_read()
+
+    def _wait_for_dependencies(self, task):
+        """
+        Blocks until the tasks that the task depends on have finished. Dependencies were queued earlier, so they
+        already hold the execution lock (or have finished), and can run while the task waits.
+        """
+        # Dependencies were enqueued earlier, so they have finished or are running in the pool
+        for dependency in task["depends_on"]:
+            dependency["done"].wait()
+
+    def _run_task(self, task):
+        failed = [dependency["id"] for dependency in task["depends_on"] if dependency["status"] == "ERROR"]
+
+        try:
+            if len(failed) == 0:
+                self.print_safe("Running task...")
+                result = task["lambda"]()
+                task["result"] = result
+                task["status"] = "SUCCESS"
+            else:
+                self.print_safe("A task it depends on had an error. SKIPPING.")
+                task["status"] = "ERROR"
+                task["error"] = "Skipped, because the task(s) it depends on failed: " + str(failed)
+
+        except:
+            tb = traceback.format_exc()
+
+            if "SystemExit" not in tb:
+                task["status"] = "ERROR"
+                task["error"] = tb
+                self.print_safe(tb)
+
+            else:
+                task["status"] = "SUCCESS"
+                task["result"] = None
+
+                # We want to allow the RCP server to send back a response before killing the process
+                def self_destruct():
+                    self.print_safe("Exiting NEURON in 1s ... ")
+                    time.sleep(0.5)
+                    quit()
+
+                thread = threading.Thread(target=self_destruct)
+                thread.start()
+
+        # Release the command closure and dependencies, and start the result retention period
+        task["lambda"] = None
+        task["depends_on"] = []
+
+        with self.task_lock:
+            task["accessed"] = time.time()
+
+            if task["id"] in self.tasks:
+                self.tasks.move_to_end(task["id"])
+
+            self.task_finished.notify_all()
+
+        # Wake up any threads waiting for the task
+        task["done"].set()
+
     def service_queue_loop(self):
         while self.service_thread_continue:
-            if not self.queue.empty():
-                self.work_on_queue_tasks()
-            else:
-                time.sleep(0.1)
+            # Block until a task arrives, instead of polling the queue
+            try:
+                task = self.queue.get(timeout=self.queue_wait_timeout)
+            except queue.Empty:
+                # Expire results even when no new tasks arrive
+                with self.task_lock:
+                    self._evict_tasks()
+
+                continue
+
+            self.work_on_queue_tasks(first_task=task)
 
     def compress(self, obj):
-        # print('X'*100, 'pre-str', obj)
-        # compressed = iterative_str(obj)
-        compressed = serialize(obj)
+        # Arrays (e.g. coords, radii, activity) are sent as binary buffers when NumPy is available. Clients that
+        # predate codec negotiation also predate the binary wire format, and only read serialized text.
+        if numpy_available and self.client_reads_wire_format:
+            data = pack(obj)
 
-        # print('X' * 100, 'post-iterative_str', obj)
+            if len(data) >= self.shared_payload_min_bytes and self.client_on_same_host():
+                return self.write_shared_payload(data)
 
-        try:
-            compressed = xmlrpclib.Binary(zlib.compress(compressed, 2)) # already-iterative
-        except:
-            compressed = xmlrpclib.Binary(zlib.compress(compressed.encode('utf8'), 2)) # already-iterative
+        else:
+            data = serialize(obj)
+
+            if not isinstance(data, bytes):
+                data = data.encode('utf8')
+
+        return xmlrpclib.Binary(self.encode_payload(data))
+
+    def encode_payload(self, data):
+        """
+        Compresses a payload with the codec that best suits its size and the link to the client
+
+        :return: The encoded bytes (see compression.encode())
+        """
+        # Clients that predate codec negotiation only read plain zlib payloads
+        if self.client_codecs is None:
+            return zlib.compress(data, 2) # already-iterative
 
-        return compressed
+        codec = compression.select_codec(
+            len(data),
+            remote=not self.client_is_local(),
+            supported=self.client_codecs,
+            preferred=self.config["compression_codec"]
+        )
+
+        return compression.encode(data, codec)
 
     def decompress(self, compressed):
-        uncompressed = deserialize(zlib.decompress(compressed.data).decode('utf-8')) # already-iterative
+        if isinstance(compressed, dict):
+            return unpack(self.read_shared_payload(compressed))
+
+        uncompressed = compression.decode(compressed.data)
 
-        # print('X'*100, uncompressed)
+        # Binary wire format arrays are views of the buffer, bytearray makes them writable
+        if uncompressed.startswith(WIRE_FORMAT_MAGIC):
+            return unpack(bytearray(uncompressed))
+
+        return deserialize(uncompressed.decode('utf-8')) # already-iterative
+
+    def client_is_local(self):
+        """
+        :return: True if the client node is reachable over loopback i.e. runs on the same host
+        """
+        if self.client_address is None:
+            return False
+
+        host = self.client_address.split("://")[-1].rsplit(":", 1)[0]
+
+        return host in ("127.0.0.1", "localhost", "::1")
+
+    def client_on_same_host(self):
+        """
+        :return: True if shared payload files can be used to send payloads to the client. Clients that predate
+            shared payloads only read Binary payloads.
+        """
+        return self.config["shared_memory_transfer"] and self.client_is_local() and \
+            self.client_capabilities.get("shared_payload", False)
+
+    def write_shared_payload(self, data):
+        """
+        Writes a payload to a RAM-backed file, so that only its descriptor is sent over RPC
+
+        :return: The descriptor of the payload, to pass to decompress() on the reading node
+        """
+        fd, path = tempfile.mkstemp(prefix="BlenderNEURON-", suffix=".payload", dir=self.shared_payload_dir)
+
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+
+        # Forget payloads that have been read
+        if len(self.shared_payloads) > 100:
+            self.shared_payloads = set(p for p in self.shared_payloads if os.path.exists(p))
+
+        self.shared_payloads.add(path)
+
+        return {"shared_payload": path, "size": len(data)}
+
+    def read_shared_payload(self, descriptor):
+        """
+        Maps a shared payload file into memory, and removes the file
+
+        :return: A copy-on-write buffer of the payload. NumPy arrays unpacked from it are writable,
+            and are not copied until written to.
+        """
+        path = descriptor["shared_payload"]
+
+        try:
+            with open(path, "rb") as f:
+                if os.name == "nt":
+                    # Mapped files cannot be removed on Windows
+                    return bytearray(f.read())
+
+                return mmap.mmap(f.fileno(), descriptor["size"], access=mmap.ACCESS_COPY)
+
+        finally:
+            os.remove(path)
+
+    def remove_shared_payloads(self):
+        for path in self.shared_payloads:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # Already read
 
-        return uncompressed
+        self.shared_payloads = set()
 
@@ -0,0 +1,141 @@
+"""
+Codecs used to compress the payloads sent between nodes (see CommNode.compress()).
+
+Encoded payloads start with a 1 byte codec id, followed by the compressed data. Payloads from nodes that
+predate codec negotiation are plain zlib streams, which are recognized by their 0x78 header byte.
+"""
+
+import zlib
+from collections import OrderedDict
+
+try:
+    import lzma
+except ImportError:  # pragma: no cover
+    lzma = None      # pragma: no cover
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class Codec(object):
+    def __init__(self, name, codec_id, compress, decompress):
+        self.name = name
+        self.codec_id = codec_id
+        self.compress = compress
+        self.decompress = decompress
+
+
+codecs = OrderedDict()
+codecs_by_id = {}
+
+# First byte of zlib streams with the default window size
+_zlib_header = 0x78
+
+# Payloads smaller than this are not compressed
+small_payload_bytes = 4 * 1024
+
+
+def register_codec(name, codec_id, compress, decompress):
+    """
+    Makes a codec available to encode() and decode()
+
+    :param codec_id: A 0-255 id, which identifies the codec in encoded payloads
+    :param compress: A function that takes bytes and returns the compressed bytes
+    :param decompress: A function that reverses compress
+    """
+    if codec_id == _zlib_header:
+        raise ValueError("Codec id " + str(codec_id) + " is reserved for legacy zlib payloads")
+
+    if codec_id in codecs_by_id and codecs_by_id[codec_id].name != name:
+        raise ValueError("Codec id " + str(codec_id) + " is already used by " + codecs_by_id[codec_id].name)
+
+    codec = Codec(name, codec_id, compress, decompress)
+    codecs[name] = codec
+    codecs_by_id[codec_id] = codec
+
+
+register_codec('none', 0, bytes, bytes)
+register_codec('zlib-1', 1, lambda data: zlib.compress(data, 1), zlib.decompress)
+register_codec('zlib-6', 2, lambda data: zlib.compress(data, 6), zlib.decompress)
+register_codec('zlib-9', 3, lambda data: zlib.compress(data, 9), zlib.decompress)
+
+if lzma is not None:
+    register_codec('lzma', 4, lambda data: lzma.compress(data, preset=6), lzma.decompress)
+
+if lz4 is not None:
+    register_codec('lz4', 5, lz4.frame.compress, lz4.frame.decompress)
+
+if zstandard is not None:
+    register_codec(
+        'zstd', 6,
+        lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data)
+    )
+
+
+def available_codecs():
+    """
+    :return: The names of the codecs that this process can encode and decode
+    """
+    return list(codecs.keys())
+
+
+def select_codec(size, remote, supported, preferred="auto"):
+    """
+    Chooses the codec for a payload
+
+    :param size: The payload size in bytes
+    :param remote: Whether the payload is sent to another host. On the same host, transfers are
+        memory copies, and compressing them costs more time than it saves.
+    :param supported: The names of the codecs that the receiving node can decode
+    :param preferred: A codec name to use whenever the receiver supports it, or "auto"
+    :return: A codec name
+    """
+    if preferred != "auto" and preferred in supported:
+        return preferred
+
+    if not remote or size < small_payload_bytes:
+        return 'none'
+
+    # zstd is faster than zlib, with a better ratio. Higher zlib levels cost more time than they save
+    # on typical links (see benchmarks/bench_compression.py).
+    for name in ('zstd', 'zlib-1'):
+        if name in supported:
+            return name
+
+    return 'none'
+
+
+def encode(data, codec_name):
+    """
+    :return: The data compressed with the codec, prefixed with the codec id
+    """
+    codec = codecs[codec_name]
+
+    return bytes(bytearray([codec.codec_id])) + codec.compress(data)
+
+
+def decode(data):
+    """
+    Reverses encode(). Also accepts legacy zlib payloads, which have no codec id prefix.
+
+    :return: The decompressed bytes
+    """
+    codec_id = bytearray(data[:1])[0]
+
+    if codec_id == _zlib_header:
+        return zlib.decompress(data)
+
+    codec = codecs_by_id.get(codec_id)
+
+    if codec is None:
+        raise ValueError("Payload is compressed with an unknown codec id: " + str(codec_id))
+
+    return codec.decompress(data[1:])
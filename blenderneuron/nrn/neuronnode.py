@@ -1,8 +1,12 @@
 from neuron import h
 from blenderneuron.commnode import CommNode
 from blenderneuron.nrn.neuronrootgroup import NeuronRootGroup
-from collections import OrderedDict
-import re, math
+from blenderneuron.nrn.neuronsection import get_section_points
+from blenderneuron.section import network_geometry, pack_network_geometry
+from collections import OrderedDict, deque
+from uuid import uuid4
+import re, math, threading
+import numpy as np
 from hashlib import sha1
 
 try:
@@ -15,11 +19,31 @@ class NeuronNode(CommNode):
     # Match Cell[n].section[y] pattern e.g. MC1[0].soma
     section_rx = re.compile('(.+?])\.?(.*)')
 
+    # Number of root list changes kept for get_roots_delta(). Older clients receive the full list.
+    root_history_size = 100
+
     def __init__(self, server_end=None, *args, **kwargs):
         self.roots = None
+        self.root_names = []
+        self.root_name_indices = {}
+        self.roots_lock = threading.Lock()
+
+        # Root list versions are only meaningful within this NEURON process
+        self.roots_session = uuid4().hex[:8]
+        self.roots_version = 0
+        # (version, added names, removed names, first changed position in the root list)
+        self.roots_history = deque(maxlen=self.root_history_size)
         self.section_index = None
+        self.indexed_sections = set()
+        self.section_index_signature = None
+
+        # Incremented when this node changes the topology in ways the section count might not reveal
+        self.topology_generation = 0
         self.synapse_sets = {}  # 'set_name': [(netcon, syn, head, neck)]
 
+        self.group_streams = {}  # stream_id: generator of (group, root) pairs
+        self.stream_next_id = 0
+
         self.parallel_ctx = None
         self.mpimap = None
         self.mpirank = None
@@ -27,15 +51,19 @@ class NeuronNode(CommNode):
         def init():
             h.load_file('stdrun.hoc')
 
-            self.server.register_function(self.get_roots)
+            # Read-only functions are shared, and can run concurrently with each other
+            self.register_function(self.get_roots, shared=True)
+            self.register_function(self.get_roots_delta, shared=True)
 
-            self.server.register_function(self.set_sim_params)
-            self.server.register_function(self.get_sim_params)
+            self.register_function(self.set_sim_params)
+            self.register_function(self.get_sim_params, shared=True)
 
-            self.server.register_function(self.initialize_groups)
-            self.server.register_function(self.update_groups)
+            self.register_function(self.initialize_groups)
+            self.register_function(self.get_group_chunk)
+            self.register_function(self.update_groups)
+            self.register_function(self.get_network_geometry)
 
-            self.server.register_function(self.create_synapses)
+            self.register_function(self.create_synapses)
 
         if server_end is None:
             server_end = "NEURON"
@@ -50,30 +78,192 @@ class NeuronNode(CommNode):
 
 
     def get_roots(self):
-        self.roots = h.SectionList()
-        self.roots.allroots()
-        self.roots = list(self.roots)
-
-        self.update_section_index()
+        self.update_roots()
 
         return [
             {
                 "index": i,
-                "name": sec.name()
+                "name": name
             }
-            for i, sec in enumerate(self.roots)
+            for i, name in enumerate(self.root_names)
         ]
 
+    def get_roots_delta(self, version=None):
+        """
+        Lists the root sections that were added or removed since the client's version of the root list
+
+        :param version: The version token returned by a previous call, or None to get the full list
+        :return: A dict with the new "version" token, "full" (True if "added" lists all roots, and
+            any roots not in it should be removed), "added" list of {"index", "name"} dicts (which may include
+            roots that the client already has, e.g. ones whose index shifted), and "removed" list of root names
+        """
+        self.update_roots()
+
+        with self.roots_lock:
+            current = self.roots_version
+            history = self.roots_history
+
+            client_version = None
+
+            if version is not None:
+                session, _, number = version.partition(":")
+
+                if session == self.roots_session:
+                    client_version = int(number)
+
+            # Can the client's list be brought up to date from the history?
+            is_delta = client_version is not None and (
+                client_version == current or
+                (0 < len(history) and history[0][0] <= client_version + 1 <= current)
+            )
+
+            if is_delta:
+                # The first change of a root tells if the client has it, the last if it still exists
+                client_has, exists = {}, OrderedDict()
+                shifted_from = len(self.root_names)
+
+                for entry_version, entry_added, entry_removed, entry_first_changed in history:
+                    if entry_version <= client_version:
+                        continue
+
+                    shifted_from = min(shifted_from, entry_first_changed)
+
+                    for name in entry_removed:
+                        client_has.setdefault(name, True)
+                        exists[name] = False
+
+                    for name in entry_added:
+                        client_has.setdefault(name, False)
+                        exists[name] = True
+
+                added = [name for name, root_exists in exists.items() if root_exists]
+                removed = [name for name, root_exists in exists.items() if not root_exists and client_has[name]]
+
+                # The indices of the roots after the first change may have shifted
+                listed = set(added)
+                added += [name for name in self.root_names[shifted_from:] if name not in listed]
+
+            else:
+                added, removed = self.root_names, []
+
+            return {
+                "version": self.roots_session + ":" + str(current),
+                "full": not is_delta,
+                "added": [{"index": self.root_name_indices[name], "name": name} for name in added],
+                "removed": removed,
+            }
+
+    def update_roots(self):
+        """
+        Refreshes the list of root sections. If the roots changed, the added and removed root names are
+        recorded in the root history (see get_roots_delta()), and the section index is rebuilt the next time it
+        is used. Only the roots are read, so that frequent polling does not walk every section.
+        """
+        with self.roots_lock:
+            roots = h.SectionList()
+            roots.allroots()
+            roots = list(roots)
+
+            # Only read the names if the roots changed
+            if roots == self.roots:
+                return
+
+            # Cells may have been replaced by the same number of sections, which NEURON's structure change
+            # count only reflects after re-initialization
+            self.invalidate_section_index()
+
+            self.roots = roots
+
+            names = [sec.name() for sec in roots]
+            previous_names = set(self.root_names)
+            new_names = set(names)
+
+            added = [name for name in names if name not in previous_names]
+            removed = [name for name in self.root_names if name not in new_names]
+
+            first_changed = next((i for i, (previous, name) in enumerate(zip(self.root_names, names))
+                                  if previous != name), min(len(self.root_names), len(names)))
+
+            # Roots that were re-created or re-ordered change positions without being added or removed
+            changed = names != self.root_names
+
+            self.root_names = names
+            self.root_name_indices = {name: i for i, name in enumerate(names)}
+
+            if changed:
+                self.roots_version += 1
+                self.roots_history.append((self.roots_version, added, removed, first_changed))
+
+    def get_topology_signature(self):
+        """
+        A cheap fingerprint of NEURON's section topology. Counting sections is much faster than reading
+        their names, and NEURON's structure change count catches changes that keep the same count (once the
+        model is re-initialized).
+
+        :return: (section count, CVode structure change count, this node's topology generation)
+        """
+        section_count = sum(1 for _ in h.allsec())
+
+        return section_count, int(h.CVode().structure_change_count()), self.topology_generation
+
+    def invalidate_section_index(self):
+        """
+        Forces the next update_section_index() to rebuild the index
+        """
+        self.topology_generation += 1
+
     def update_section_index(self):
-        all_sec = h.allsec()
+        """
+        Updates the {name: section} index of all NEURON sections. Nothing is done if the topology has not
+        changed since the last update. If sections were only added, they are added to the existing index.
+        Otherwise, the index is rebuilt.
+        """
+        signature = self.get_topology_signature()
+        previous = self.section_index_signature
+
+        if self.section_index is not None and signature == previous:
+            return
+
+        self.section_index_signature = signature
+
+        # Only new sections - patch the index
+        if self.section_index is not None and previous is not None and \
+                signature[1:] == previous[1:] and signature[0] > previous[0]:
+
+            indexed = self.indexed_sections
+
+            for sec in h.allsec():
+                if sec not in indexed:
+                    indexed.add(sec)
+                    self.section_index[sec.name()] = sec
+
+            # Sections could have been removed as well as added
+            if len(indexed) == signature[0]:
+                return
+
+        all_sec = list(h.allsec())
+        self.indexed_sections = set(all_sec)
         self.section_index = {sec.name(): sec for sec in all_sec}
 
-    def initialize_groups(self, blender_groups, send_back=True):
+    def initialize_groups(self, blender_groups, send_back=True, stream=False):
+        """
+        Creates NEURON groups from the skeletal Blender group dicts
+
+        :param blender_groups: List of group dicts, with root names
+        :param send_back: Whether to return the full group data (e.g. 3D data, activity)
+        :param stream: If True, returns a stream id instead of the full group data. The data can then be
+            retrieved in batches of roots with get_group_chunk()
+        :return: The compressed group dicts, a stream id, or None
+        """
+
+        # Stop recording the replaced groups
+        for group in self.groups.values():
+            group.remove_collector()
 
         self.groups = OrderedDict()
+        self.group_streams = {}
 
-        if self.section_index is None:
-            self.update_section_index()
+        self.update_section_index()
 
         for blender_group in blender_groups:
             name = blender_group["name"]
@@ -83,17 +273,31 @@ class NeuronNode(CommNode):
 
             self.groups[name] = nrn_group
 
+        if stream:
+            return self.open_group_stream()
+
         if send_back:
             return self.get_group_dicts()
 
-    def get_group_dicts(self, compressed=True):
-
+    def run_recording_groups(self):
         if any([g.record_activity for g in self.groups.values()]):
             h.run()
 
+            for group in self.groups.values():
+                group.harvest_activity()
+
+                # Send only the points that Blender would keep
+                if group.record_activity and group.simplify_in_neuron:
+                    group.simplify_recorded_activity()
+
+    def get_group_dicts(self, compressed=True):
+
+        self.run_recording_groups()
+
         result = [group.to_dict(include_activity=group.record_activity,
                   include_root_children=True,
-                  include_coords_and_radii=True)
+                  include_coords_and_radii=True,
+                  as_arrays=compressed)
                   for group in self.groups.values()]
 
         if compressed:
@@ -101,6 +305,134 @@ class NeuronNode(CommNode):
         else:
             return result
 
+    def open_group_stream(self):
+        self.run_recording_groups()
+
+        def group_roots():
+            for group in self.groups.values():
+                # None marks the start of a group
+                yield group, None
+
+                for root in group.roots.values():
+                    yield group, root
+
+        stream_id = self.stream_next_id
+        self.stream_next_id += 1
+
+        self.group_streams[stream_id] = group_roots()
+
+        return stream_id
+
+    def get_group_chunk(self, stream_id, max_roots):
+        """
+        Gets the next batch of group roots from a stream opened with initialize_groups(..., stream=True).
+        Root dicts are only created for the roots in the batch.
+
+        The first entry of each group contains the group-level data (e.g. settings, activity times).
+        Later entries of the same group contain only the group name and the next roots.
+        The 3D points of the roots in an entry are sent in one flat "geometry" block (see network_geometry()),
+        and the root dicts contain only the section tree and activity.
+
+        :param stream_id: The id returned by initialize_groups()
+        :param max_roots: The maximum number of roots to include in the batch
+        :return: A compressed list of partial group dicts. The list is empty when the stream is exhausted.
+        """
+        stream = self.group_streams.get(stream_id)
+
+        if stream is None:
+            raise Exception("Group stream " + str(stream_id) + " does not exist or was already read")
+
+        chunk = []
+        chunk_roots = []  # The roots of each chunk entry
+        root_count = 0
+
+        while root_count < max_roots:
+            group, root = next(stream, (None, None))
+
+            # Remove the stream once its end has been sent
+            if group is None:
+                if len(chunk) == 0:
+                    self.group_streams.pop(stream_id)
+
+                break
+
+            if root is None:
+                chunk.append(group.to_dict(include_activity=group.record_activity,
+                                           include_roots=False,
+                                           as_arrays=True))
+                chunk_roots.append([])
+
+            else:
+                if len(chunk) == 0 or chunk[-1]["name"] != group.name:
+                    chunk.append({"name": group.name, "roots": []})
+                    chunk_roots.append([])
+
+                chunk[-1]["roots"].append(root.to_dict(include_activity=group.record_activity,
+                                                       include_children=True,
+                                                       include_coords_and_radii=False,
+                                                       as_arrays=True,
+                                                       quantization=group.activity_quantization))
+                chunk_roots[-1].append(root)
+                root_count += 1
+
+        for entry, roots in zip(chunk, chunk_roots):
+            if roots:
+                entry["geometry"] = network_geometry(roots)
+
+        return self.compress(chunk)
+
+    def get_network_geometry(self, root_names=None, compressed=True):
+        """
+        Gets the morphology of whole cells in a flat, columnar layout. Sections are listed parents-first, and
+        the points of section i are coords[point_offsets[i] * 3:(point_offsets[i] + point_counts[i]) * 3].
+
+        :param root_names: Names of the root sections of the cells to include. None includes all cells.
+        :param compressed: Whether to compress the result for sending over RPC
+        :return: A dict with "names", "parent_indices" (-1 for roots), "point_offsets", "point_counts",
+            "coords" (flat x,y,z), "radii", "parent_connection_locs" (NaN for roots), "connection_ends",
+            and "nseg"
+        """
+        if root_names is None:
+            roots = h.SectionList()
+            roots.allroots()
+            roots = list(roots)
+
+        else:
+            self.update_section_index()
+
+            roots = [self.section_index[self.rank_section_name(name)] for name in root_names]
+
+        names, parents, connection_locs, connection_ends, nsegs = [], [], [], [], []
+        coords, radii = [], []
+
+        # Parents-first (pre-order) traversal of each cell
+        stack = [(root, -1) for root in reversed(roots)]
+
+        while stack:
+            nrn_sec, parent_index = stack.pop()
+            index = len(names)
+
+            names.append(nrn_sec.name())
+            parents.append(parent_index)
+            nsegs.append(nrn_sec.nseg)
+            connection_ends.append(nrn_sec.orientation())
+
+            parent_seg = nrn_sec.parentseg()
+            connection_locs.append(parent_seg.x if parent_seg is not None else np.nan)
+
+            sec_coords, sec_radii = get_section_points(nrn_sec)
+            coords.append(sec_coords)
+            radii.append(sec_radii)
+
+            stack.extend((child, index) for child in reversed(nrn_sec.children()))
+
+        result = pack_network_geometry(names, parents, connection_locs, connection_ends, nsegs, coords, radii)
+
+        if compressed:
+            return self.compress(result)
+
+        return result
+
     def update_groups(self, blender_groups):
 
         for blender_group in blender_groups:
@@ -210,6 +542,11 @@ class NeuronNode(CommNode):
 
         synapses = self.synapse_sets[set_name] = []
 
+        self.update_section_index()
+
+        # Any replaced spine sections are gone, and new ones will be created
+        self.invalidate_section_index()
+
         for entry in syn_entries:
 
             rank_source_section = self.rank_section_name(entry['source_section'])
@@ -1,7 +1,9 @@
 from blenderneuron.nrn.neuronsection import NeuronSection
 from blenderneuron.rootgroup import RootGroup
-from blenderneuron.activity import Activity
+from blenderneuron.activity import Activity, SampleBuffer
 from neuron import h
+import numpy as np
+import math
 
 
 class NeuronRootGroup(RootGroup):
@@ -17,6 +19,9 @@ class NeuronRootGroup(RootGroup):
                 section = self.roots[sec_name]
                 section.from_updated_blender_root(blender_root)
 
+        # Recording locations depend on the updated 3D points and recording params
+        self.create_collector()
+
     def from_skeletal_blender_group(self, blender_group, node):
         self.node = node
         self.name = blender_group['name']
@@ -44,25 +49,260 @@ class NeuronRootGroup(RootGroup):
         self.recording_period = blender_group["recording_period"]
         self.recording_time_start = blender_group["recording_time_start"]
         self.recording_time_end = blender_group["recording_time_end"]
+        self.recording_engine = blender_group.get("recording_engine", self.recording_engine)
+        self.recording_window = blender_group.get("recording_window", self.recording_window)
+        self.activity_quantization = blender_group.get("activity_quantization", self.activity_quantization)
+        self.simplification_epsilon = blender_group.get("simplification_epsilon", self.simplification_epsilon)
+        self.simplify_in_neuron = blender_group.get("simplify_in_neuron", self.simplify_in_neuron)
 
     def create_collector(self):
+        """
+        Sets up the recording of the group activity during h.run(). With the 'vector' recording engine, each
+        recorded location gets a NEURON Vector, and the values are gathered after the run with
+        harvest_activity(). Otherwise, a NetStim triggers collect() every recording period.
+        Rolling windows are always recorded with collect(), whose buffers hold only the window, while
+        Vectors would grow for the whole run.
+        This method does nothing if group.record_activity is False
+        """
+        self.remove_collector()
+
+        if not self.record_activity:
+            return
+
+        if self.recording_engine == 'vector' and self.recording_window <= 0:
+            try:
+                self.create_recorders()
+                return
+
+            # Variables without a range variable pointer can only be collected by callback
+            except AttributeError:
+                self.remove_collector()
+
+        self.create_callback_collector()
+
+    def remove_collector(self):
+        self.collector_stim = None
+        self.collector_con = None
+
+        self.recorders = None
+        self.recorder_times = None
+        self.recorder_fih = None
+
+        self.sampling_plan = None
+        self.sample_buffer = None
+        self.sample_locations = None
+        self.samples = None
+        self.sample_capacity = (None, False)
+
+    def get_sample_capacity(self):
+        """
+        :return: (capacity, rolling) for the activity buffers. The number of samples in the recording window,
+            or until the recording end time (or tstop)
+        """
+        if self.recording_window > 0:
+            return int(math.floor(self.recording_window / self.recording_period + 1e-9)) + 1, True
+
+        end = h.tstop
+
+        if self.recording_time_end != 0:
+            end = min(end, self.recording_time_end)
+
+        samples = int(math.floor((end - self.recording_time_start) / self.recording_period + 1e-9)) + 1
+
+        return max(samples, 0), False
+
+    def clear_activity(self):
+        super(NeuronRootGroup, self).clear_activity()
+
+        # The Vector engine stores the values after the run (see harvest_activity())
+        if self.collector_con is None:
+            return
+
+        # Preallocate the buffers that collect() writes to
+        capacity, rolling = self.sample_capacity = self.get_sample_capacity()
+
+        self.activity.allocate(capacity, rolling)
+
+        if self.sampling_plan is not None:
+            self.samples = SampleBuffer(capacity, len(self.sample_locations), rolling)
+
+        # 3D segment activities are allocated as they are created
+        elif self.recording_granularity in ('Section', 'Cell'):
+            for root in self.roots.values():
+                stack = [root]
+
+                while stack:
+                    node = stack.pop()
+                    node.activity.allocate(capacity, rolling)
+
+                    if self.recording_granularity == 'Section':
+                        stack.extend(node.children)
+
+    def get_recording_locations(self):
+        """
+        Lists the locations to record from, based on the group's recording granularity
+
+        :return: A list of (section, 3D segment index, NEURON segment). The section is None for the group-level
+            mean of somas, and the 3D segment index is None for section-level values.
+        """
+        level = self.recording_granularity
+        locations = []
+
+        for root in self.roots.values():
+
+            # From the middle of somas of each cell
+            if level not in ('3D Segment', 'Section'):
+                locations.append((root if level == 'Cell' else None, None, root.nrn_section(0.5)))
+                continue
+
+            stack = [root]
+
+            while stack:
+                node = stack.pop()
+                nrn_sec = node.nrn_section
+
+                # From the middle of each section of each cell
+                if level == 'Section':
+                    locations.append((node, None, nrn_sec(0.5)))
+
+                # From the middle of each 3D segment of each section (see NeuronSection.collect_segments_recursive)
+                else:
+                    for i in range(1, int(h.n3d(sec=nrn_sec))):
+                        startL = h.arc3d(i - 1, sec=nrn_sec)
+                        endL = h.arc3d(i, sec=nrn_sec)
+
+                        x_mid = min(max((startL + endL) / (2.0 * nrn_sec.L), 0.0), 1.0)
+
+                        locations.append((node, i - 1, nrn_sec(x_mid)))
+
+                stack.extend(reversed(node.children))
+
+        return locations
+
+    def create_recorders(self):
+        """
+        Creates a Vector recording of the group's record_variable at each recording location. The values are
+        sampled at the same times as collect() would be called.
+        """
+        ref_name = '_ref_' + self.record_variable
+
+        self.recorder_times = h.Vector()
+        self.recorders = []
+
+        for section, seg_index, segment in self.get_recording_locations():
+            vector = h.Vector()
+            vector.record(getattr(segment, ref_name), self.recorder_times, sec=segment.sec)
+
+            self.recorders.append((section, seg_index, vector))
+
+        # The sample times depend on tstop, so they are set when the simulation is initialized
+        self.recorder_fih = h.FInitializeHandler(0, self.set_recording_times)
+
+    def set_recording_times(self):
+        end = h.tstop
+
+        if self.recording_time_end != 0:
+            end = min(end, self.recording_time_end)
+
+        self.recorder_times.indgen(self.recording_time_start, end, self.recording_period)
+
+    def harvest_activity(self):
+        """
+        Copies the values recorded by the Vector recording engine, or gathered with the callback collector's
+        sampling plan, to the group, section, and 3D segment activities. Called after h.run().
+        """
+        if self.recorders:
+            # Vectors are shorter than the sample times if the run was stopped early
+            count = min(int(vector.size()) for _, _, vector in self.recorders)
+
+            self.activity.times = np.array(self.recorder_times)[:count]
+
+            locations = [(section, seg_index) for section, seg_index, _ in self.recorders]
+            location_values = [np.array(vector)[:count] for _, _, vector in self.recorders]
+
+        elif self.sampling_plan is not None:
+            if self.samples is None:
+                return
+
+            # One row of samples per collect() call
+            locations = self.sample_locations
+            location_values = self.samples.get().T
+
+        else:
+            return
+
+        group_values = []
+
+        for (section, seg_index), values in zip(locations, location_values):
+            if section is None:
+                group_values.append(values)
+
+            elif seg_index is None:
+                section.activity.values = values
+
+            else:
+                activity = section.segment_activity[seg_index] = Activity()
+                activity.values = values
+
+        if group_values:
+            self.activity.values = np.mean(group_values, axis=0)
+
+    def simplify_recorded_activity(self):
+        """
+        Simplifies the section and 3D segment activities with the group's simplification_epsilon, so that only the
+        kept points are sent to Blender. The group activity is kept whole, because its times are the time base of
+        all the traces.
+        """
+        times = self.activity.times
+
+        for root in self.roots.values():
+            self.set_activity_times(root, times)
+
+        self.simplify_activity(list(self.roots.values()))
+
+    def create_callback_collector(self):
         """
         Greates a pair of NetStim and NetCon which trigger an event to recursively collect the activity of the group
-        segments. This method does nothing if group.record_activity is False
+        segments
         """
+        try:
+            self.create_sampling_plan()
+
+        # Without range variable pointers, collect() reads the values one at a time
+        except AttributeError:
+            self.sampling_plan = None
 
-        if self.record_activity:
-            collector_stim = h.NetStim(0.5)
-            collector_stim.start = self.recording_time_start
-            collector_stim.interval = self.recording_period
-            collector_stim.number = 1e9
-            collector_stim.noise = 0
+        collector_stim = h.NetStim(0.5)
+        collector_stim.start = self.recording_time_start
+        collector_stim.interval = self.recording_period
+        collector_stim.number = 1e9
+        collector_stim.noise = 0
 
-            collector_con = h.NetCon(collector_stim, None)
-            collector_con.record((self.collect))
+        collector_con = h.NetCon(collector_stim, None)
+        collector_con.record((self.collect))
 
-            self.collector_stim = collector_stim
-            self.collector_con = collector_con
+        self.collector_stim = collector_stim
+        self.collector_con = collector_con
+
+    def create_sampling_plan(self):
+        """
+        Precomputes the recording locations (geometry does not change during a run), so that collect() can
+        read all of them with a single PtrVector gather
+        """
+        ref_name = '_ref_' + self.record_variable
+        locations = self.get_recording_locations()
+
+        if not locations:
+            return
+
+        plan = h.PtrVector(len(locations))
+
+        for i, (_, _, segment) in enumerate(locations):
+            plan.pset(i, getattr(segment, ref_name))
+
+        self.sampling_plan = plan
+        self.sample_buffer = h.Vector(len(locations))
+        self.sample_locations = [(section, seg_index) for section, seg_index, _ in locations]
 
     def collect(self):
         """
@@ -78,7 +318,12 @@ class NeuronRootGroup(RootGroup):
                 (self.recording_time_end != 0 and time > self.recording_time_end):
             return
 
-        self.activity.times.append(time)
+        self.activity.add_time(time)
+
+        if self.sampling_plan is not None:
+            self.sampling_plan.gather(self.sample_buffer)
+            self.samples.append(self.sample_buffer.as_numpy())
+            return
 
         level = self.recording_granularity
 
@@ -104,7 +349,7 @@ class NeuronRootGroup(RootGroup):
             # Compute the mean of group cell somas
             value = 0.0
             for root in self.roots.values():
-                value += getattr(root(0.5), variable)
+                value += getattr(root.nrn_section(0.5), variable)
             value = value / len(self.roots)
 
-            self.activity.values.append(value)
+            self.activity.add_value(value)
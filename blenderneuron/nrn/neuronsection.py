@@ -4,7 +4,53 @@ from neuron import h
 import numpy as np
 
 
+def point_getters(nrn_section):
+    """
+    :return: The x3d, y3d, z3d, and diam3d functions of a section, which take a 3D point index
+    """
+    # Section methods (NEURON 7.7+) are much faster than h.x3d(i, sec=...), which pushes the section
+    # onto the HOC section stack on every call
+    if hasattr(nrn_section, "x3d"):
+        return nrn_section.x3d, nrn_section.y3d, nrn_section.z3d, nrn_section.diam3d
+
+    return (
+        lambda i: h.x3d(i, sec=nrn_section),
+        lambda i: h.y3d(i, sec=nrn_section),
+        lambda i: h.z3d(i, sec=nrn_section),
+        lambda i: h.diam3d(i, sec=nrn_section),
+    )
+
+
+def get_section_points(nrn_section):
+    """
+    Reads the 3D points of a section, letting NEURON create them if missing
+
+    :return: (coords, radii) where coords is a flat x,y,z float32 array, and radii is a float32 array
+    """
+    # Count 3D points
+    point_count = int(h.n3d(sec=nrn_section))
+
+    # Let NEURON create them if missing
+    if point_count == 0:
+        h.define_shape(sec=nrn_section)
+        point_count = int(h.n3d(sec=nrn_section))
+
+    # Collect the coordinates, one whole column at a time
+    points = range(point_count)
+    x3d, y3d, z3d, diam3d = point_getters(nrn_section)
+
+    coords = np.empty((point_count, 3), dtype=Section.coords_dtype) # 3 for xy and z
+    coords[:, 0] = np.fromiter(map(x3d, points), np.float64, point_count)
+    coords[:, 1] = np.fromiter(map(y3d, points), np.float64, point_count)
+    coords[:, 2] = np.fromiter(map(z3d, points), np.float64, point_count)
+
+    radii = np.fromiter(map(diam3d, points), np.float64, point_count) / 2.0
+
+    return coords.reshape(-1), radii.astype(Section.coords_dtype)
+
+
 class NeuronSection(Section):
+    __slots__ = ("group", "nrn_section")
 
     def from_updated_blender_root(self, blender_section):
         """
@@ -68,9 +114,7 @@ class NeuronSection(Section):
 
     def update_coords_and_radii(self, blender_section):
         self.nseg = blender_section["nseg"]
-        self.point_count = blender_section["point_count"]
-        self.coords = blender_section["coords"]
-        self.radii = blender_section["radii"]
+        self.set_coords_and_radii(blender_section["coords"], blender_section["radii"])
 
         nrn_section = self.nrn_section
 
@@ -81,8 +125,8 @@ class NeuronSection(Section):
         h.pt3dclear(self.point_count, sec=nrn_section)
 
         # Use vectorization to add the points to section
-        coords = np.array(self.coords).reshape((-1, 3))
-        diams = np.array(self.radii) * 2.0
+        coords = self.coords.reshape((-1, 3))
+        diams = self.radii * 2.0
 
         xvec = h.Vector(coords[:,0])
         yvec = h.Vector(coords[:,1])
@@ -95,30 +139,9 @@ class NeuronSection(Section):
 
         nrn_section = self.nrn_section
 
-        # Count 3D points
-        point_count = int(h.n3d(sec=nrn_section))
-
-        # Let NEURON create them if missing
-        if point_count == 0:
-            h.define_shape(sec=self.nrn_section)
-            point_count = int(h.n3d(sec=self.nrn_section))
-
-        # Collect the coordinates
-        coords = [None] * point_count * 3 # 3 for xy and z
-        radii = [None] * point_count
-
-        for c in range(point_count):
-            ci = c * 3
-            coords[ci]     = h.x3d(c, sec=nrn_section)
-            coords[ci + 1] = h.y3d(c, sec=nrn_section)
-            coords[ci + 2] = h.z3d(c, sec=nrn_section)
-
-            radii[c] = h.diam3d(c, sec=nrn_section) / 2.0
-
         self.nseg = int(nrn_section.nseg)
-        self.point_count = point_count
-        self.coords = coords
-        self.radii = radii
+        self.coords, self.radii = get_section_points(nrn_section)
+        self.point_count = len(self.radii)
 
     def collect_segments_recursive(self):
         """
@@ -143,7 +166,7 @@ class NeuronSection(Section):
             for i in range(1, npts):
                 seg_index = i - 1
                 if seg_index not in node.segment_activity:
-                    node.segment_activity[seg_index] = Activity()
+                    node.segment_activity[seg_index] = Activity(*node.group.sample_capacity)
 
                 startL = h.arc3d(i - 1, sec=nrn_sec)
                 endL = h.arc3d(i, sec=nrn_sec)
@@ -152,7 +175,7 @@ class NeuronSection(Section):
                 x_mid = min(max(x_mid, 0.0), 1.0)  # clamp to [0,1]
                 value = getattr(nrn_sec(x_mid), record_var)
 
-                node.segment_activity[seg_index].values.append(value)
+                node.segment_activity[seg_index].add_value(value)
 
             # Traverse child sections
             stack.extend(reversed(node.children))
@@ -169,7 +192,7 @@ class NeuronSection(Section):
         while stack:
             node = stack.pop()
             value = getattr(node.nrn_section(0.5), node.group.record_variable)
-            node.activity.values.append(value)
+            node.activity.add_value(value)
             if recursive:
                 # Add children to stack in reverse order to maintain traversal order
                 stack.extend(reversed(node.children))
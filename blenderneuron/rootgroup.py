@@ -1,6 +1,6 @@
 from abc import ABCMeta, abstractmethod
 from collections import OrderedDict
-from blenderneuron.activity import Activity
+from blenderneuron.activity import Activity, simplify_traces
 
 class RootGroup:
     __metaclass__ = ABCMeta
@@ -18,6 +18,12 @@ class RootGroup:
         self.recording_period = 1.0
         self.recording_time_start = 0
         self.recording_time_end = 0
+        self.recording_engine = 'vector'  # 'vector' or 'callback' (see NeuronRootGroup.create_collector)
+        self.recording_window = 0  # Only keep the last ms of activity (always uses the callback engine). 0 keeps all.
+        self.activity_quantization = 'significant'  # See activity.quantize()
+        self.simplification_epsilon = 0.1
+        self.simplify_in_neuron = False  # Simplify activity before it is sent from NEURON (see simplify_activity)
+        self.simplification_workers = 1  # Processes used to simplify activity. 0 uses all CPU cores (opt-in).
 
         self.activity = Activity()
 
@@ -40,20 +46,25 @@ class RootGroup:
     def to_dict(self,
                 include_activity=False,
                 include_root_children=False,
-                include_coords_and_radii=False):
+                include_coords_and_radii=False,
+                as_arrays=False,
+                include_roots=True):
         """
 
         :param include_activity:
         :param include_root_children:
         :param include_coords_and_radii:
+        :param as_arrays: Leave coords, radii, and activity as arrays for the binary wire format
+        :param include_roots: When False, the roots list is left empty (e.g. roots are sent separately)
         :return:
         """
         result = {
             "name": self.name,
             "roots": [
-                root.to_dict(include_activity, include_root_children, include_coords_and_radii) # already-iterative
+                root.to_dict(include_activity, include_root_children, include_coords_and_radii, as_arrays,
+                             self.activity_quantization) # already-iterative
                 for root in self.roots.values()
-            ],
+            ] if include_roots else [],
             "import_synapses": self.import_synapses,
             "interaction_granularity": self.interaction_granularity,
             "record_activity": self.record_activity,
@@ -62,12 +73,68 @@ class RootGroup:
             "recording_period": self.recording_period,
             "recording_time_start": self.recording_time_start,
             "recording_time_end": self.recording_time_end,
+            "recording_engine": self.recording_engine,
+            "recording_window": self.recording_window,
+            "activity_quantization": self.activity_quantization,
+            "simplification_epsilon": self.simplification_epsilon,
+            "simplify_in_neuron": self.simplify_in_neuron,
         }
 
         if include_activity:
             result.update({
-                "activity": self.activity.to_dict(), # already-iterative
+                "activity": self.activity.to_dict(as_arrays, self.activity_quantization), # already-iterative
             })
 
         return result
 
+    def set_activity_times(self, root, times):
+        """
+        Iteratively sets the activity times for each node starting from the root node.
+
+        :param root: The root node whose activity times need to be set.
+        :param times: The times to set for the activity.
+        :return: None
+        """
+        # Initialize a stack with the root node
+        stack = [root]
+
+        while stack:
+            node = stack.pop()
+            # All traces share the group times
+            node.activity.set_time_base(times)
+            for act in node.segment_activity.values():
+                act.set_time_base(times)
+
+            # Add child nodes to the stack to process them iteratively
+            if node.children:
+                # Reverse the children to maintain traversal order
+                stack.extend(reversed(node.children))
+
+    def simplify_activity(self, roots):
+        """
+        Iteratively gathers the activity of each node starting from the root nodes, and simplifies all the traces
+        together (see activity.simplify_traces), with simplification_workers processes. Traces that were already
+        simplified (e.g. in NEURON, see simplify_in_neuron) are left as they are.
+
+        :param roots: The root nodes whose activity needs to be simplified.
+        :return: None
+        """
+        # Initialize a stack with the root nodes
+        stack = list(reversed(roots))
+        traces = []
+
+        while stack:
+            node = stack.pop()
+            # Gather the activity of the current node
+            for act in [node.activity] + list(node.segment_activity.values()):
+                if act.time_indices is None:
+                    traces.append(act)
+
+            # Add child nodes to the stack to process them iteratively
+            if node.children:
+                # Reverse the children to maintain traversal order
+                stack.extend(reversed(node.children))
+
+        simplify_traces(self.activity.times, traces, self.simplification_epsilon,
+                        workers=self.simplification_workers)
+
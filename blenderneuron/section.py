@@ -1,18 +1,79 @@
 from abc import ABCMeta
 
+import numpy as np
+
 from blenderneuron.activity import Activity
 
 
+def pack_network_geometry(names, parents, connection_locs, connection_ends, nsegs, coords, radii):
+    """
+    Packs per-section lists, listed parents-first, into the flat columnar geometry layout (see
+    NeuronNode.get_network_geometry())
+
+    :param coords: A list of flat x,y,z arrays, one for each section
+    :param radii: A list of radii arrays, one for each section
+    """
+    point_counts = np.array([len(r) for r in radii], dtype=np.int32)
+
+    return {
+        "names": names,
+        "parent_indices": np.array(parents, dtype=np.int32),
+        "point_offsets": np.cumsum(point_counts, dtype=np.int64) - point_counts,
+        "point_counts": point_counts,
+        "coords": np.concatenate(coords) if coords else np.zeros(0, dtype=np.float32),
+        "radii": np.concatenate(radii) if radii else np.zeros(0, dtype=np.float32),
+        "parent_connection_locs": np.array(connection_locs, dtype=np.float64),
+        "connection_ends": np.array(connection_ends, dtype=np.float64),
+        "nseg": np.array(nsegs, dtype=np.int32),
+    }
+
+
+def network_geometry(roots):
+    """
+    Gets the geometry of section trees in the flat columnar layout. Sections are listed in the same
+    parents-first order as the children of Section.to_dict().
+
+    :param roots: A list of root Sections
+    """
+    names, parents, connection_locs, connection_ends, nsegs = [], [], [], [], []
+    coords, radii = [], []
+
+    stack = [(root, -1) for root in reversed(roots)]
+
+    while stack:
+        node, parent_index = stack.pop()
+        index = len(names)
+
+        names.append(node.name)
+        parents.append(parent_index)
+        nsegs.append(node.nseg)
+        connection_ends.append(node.connection_end)
+        connection_locs.append(node.parent_connection_loc if parent_index >= 0 else np.nan)
+        coords.append(node.coords)
+        radii.append(node.radii)
+
+        stack.extend((child, index) for child in reversed(node.children))
+
+    return pack_network_geometry(names, parents, connection_locs, connection_ends, nsegs, coords, radii)
+
+
 class Section:
     __metaclass__ = ABCMeta
 
+    # Large networks have millions of sections, so avoid a per-instance __dict__
+    __slots__ = ("name", "nseg", "point_count", "coords", "radii", "children",
+                 "parent_connection_loc", "connection_end", "activity", "segment_activity")
+
+    # NEURON stores 3D points in single precision
+    coords_dtype = np.float32
+
     def __init__(self):
         self.name = ""
 
         self.nseg = None
         self.point_count = 0
-        self.coords = []
-        self.radii = []
+        self.coords = np.zeros(0, dtype=self.coords_dtype)  # Flat x,y,z array
+        self.radii = np.zeros(0, dtype=self.coords_dtype)
 
         self.children = []
         self.parent_connection_loc = -1
@@ -24,7 +85,13 @@ class Section:
     def __str__(self):
         return self.name
 
-    def to_dict(self, include_activity=True, include_children=True, include_coords_and_radii=True):
+    def to_dict(self, include_activity=True, include_children=True, include_coords_and_radii=True,
+                as_arrays=False, quantization='significant'):
+        """
+        :param as_arrays: When True, coords, radii, and activity are left as arrays for the binary wire
+            format (see blenderneuron.utils.pack). Otherwise, they are converted to lists.
+        :param quantization: How to reduce the precision of activity values (see activity.quantize())
+        """
         # Helper function to build a dict for a given node
         def build_node_dict(node):
             node_dict = {
@@ -34,16 +101,22 @@ class Section:
             }
 
             if include_activity:
-                node_dict["activity"] = node.activity.to_dict()
+                # Traces use the group time base, which is sent once with the group
+                node_dict["activity"] = node.activity.to_dict(as_arrays, quantization, include_times=False)
                 node_dict["segment_activity"] = {
-                    str(i): act.to_dict() for i, act in node.segment_activity.items()
+                    str(i): act.to_dict(as_arrays, quantization, include_times=False)
+                    for i, act in node.segment_activity.items()
                 }
 
             if include_coords_and_radii:
                 node_dict["nseg"] = node.nseg
                 node_dict["point_count"] = node.point_count
-                node_dict["coords"] = node.coords if isinstance(node.coords, list) else node.coords.tolist()
-                node_dict["radii"] = node.radii if isinstance(node.radii, list) else node.radii.tolist()
+                if as_arrays:
+                    node_dict["coords"] = node.coords
+                    node_dict["radii"] = node.radii
+                else:
+                    node_dict["coords"] = node.coords.tolist()
+                    node_dict["radii"] = node.radii.tolist()
 
             return node_dict
 
@@ -63,6 +136,17 @@ class Section:
 
         return result
 
+    def set_coords_and_radii(self, coords, radii):
+        """
+        Stores the 3D points as flat arrays, without copying them if they already are (e.g. from the wire format)
+
+        :param coords: A sequence of x,y,z values, or of [x,y,z] points
+        :param radii: A sequence of point radii
+        """
+        self.coords = np.asarray(coords, dtype=self.coords_dtype).reshape(-1)
+        self.radii = np.asarray(radii, dtype=self.coords_dtype).reshape(-1)
+        self.point_count = len(self.radii)
+
     def clear_segment_activity(self):
         # Clear the activity of the 3D segments in the current object
         self.segment_activity = {}
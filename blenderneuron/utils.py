@@ -1,3 +1,26 @@
+import struct
+import threading
+from contextlib import contextmanager
+
+try:
+    import numpy as np
+    numpy_available = True
+except ImportError:
+    numpy_available = False
+
+# Binary wire format: MAGIC | version (uint8) | header length (uint32) | header | array buffers
+# The header is the serialize()'d payload structure, with each array replaced by a buffer descriptor
+WIRE_FORMAT_MAGIC = b'BNWF'
+WIRE_FORMAT_VERSION = 1
+
+# Numeric lists stored under these keys are sent as binary buffers instead of header text
+WIRE_ARRAY_KEYS = ('coords', 'radii', 'times', 'values', 'time_indices')
+
+_wire_prefix = struct.Struct('<4sBI')
+_wire_buffer_key = '__buffer__'
+_wire_alignment = 8
+
+
 def serialize(obj):
     result = []
     stack = []
@@ -48,6 +71,10 @@ def serialize(obj):
             elif isinstance(obj, (int, float, bool, type(None))):
                 result.append(str(obj))
 
+            elif hasattr(obj, 'tolist'):
+                # NumPy arrays and scalars are written as the equivalent lists and numbers
+                stack.append(('value', obj.tolist()))
+
             else:
                 raise TypeError(f"Unsupported type: {type(obj)}")
 
@@ -220,3 +247,161 @@ def deserialize(input_str):
 
     return current
 
+
+
+def pack(obj):
+    """
+    Packs a payload of dicts/lists/scalars into the binary wire format. NumPy arrays, and numeric lists
+    stored under WIRE_ARRAY_KEYS, are written as contiguous buffers instead of per-float text.
+
+    :param obj: The payload e.g. a list of group dicts
+    :return: bytes that can be read with unpack()
+    """
+    buffers = []
+    offset = 0
+
+    # The header is a copy of the payload structure - the source payload is not modified
+    header = [obj]
+    stack = [(header, 0, None)]
+
+    while stack:
+        container, key, parent_key = stack.pop()
+        value = container[key]
+
+        if isinstance(value, dict):
+            value = container[key] = dict(value)
+            stack.extend((value, k, k) for k in value.keys())
+            continue
+
+        if isinstance(value, (list, tuple)) and parent_key in WIRE_ARRAY_KEYS:
+            try:
+                value = np.asarray(value)
+                if value.dtype.kind not in 'biuf':
+                    raise TypeError()
+            except (TypeError, ValueError):
+                value = container[key]
+
+        if isinstance(value, np.ndarray):
+            array = np.ascontiguousarray(value)
+            padding = -array.nbytes % _wire_alignment
+
+            container[key] = {_wire_buffer_key: [array.dtype.str, offset, list(array.shape)]}
+
+            buffers.append(array.reshape(-1).view(np.uint8))
+            buffers.append(b'\0' * padding)
+            offset += array.nbytes + padding
+
+        elif isinstance(value, (list, tuple)):
+            value = container[key] = list(value)
+            stack.extend((value, i, parent_key) for i in range(len(value)))
+
+    header = serialize(header[0]).encode('utf-8')
+    header_padding = b' ' * (-(_wire_prefix.size + len(header)) % _wire_alignment)
+
+    prefix = _wire_prefix.pack(WIRE_FORMAT_MAGIC, WIRE_FORMAT_VERSION, len(header) + len(header_padding))
+
+    return b''.join([prefix, header, header_padding] + buffers)
+
+
+def unpack(data):
+    """
+    Reads a payload created with pack(). Arrays are returned as NumPy views of the data buffer (no per-float
+    copies), so pass a bytearray (or other writable buffer) if the arrays need to be writable.
+
+    :param data: A bytes-like object starting with the wire format prefix
+    :return: The payload, with buffers as NumPy arrays
+    """
+    magic, version, header_length = _wire_prefix.unpack_from(data)
+
+    if magic != WIRE_FORMAT_MAGIC:
+        raise ValueError("Payload is not in the BlenderNEURON binary wire format")
+
+    if version != WIRE_FORMAT_VERSION:
+        raise ValueError("Unsupported wire format version: " + str(version) +
+                         ". Expected: " + str(WIRE_FORMAT_VERSION))
+
+    buffers_start = _wire_prefix.size + header_length
+    header = bytes(data[_wire_prefix.size:buffers_start]).decode('utf-8')
+
+    result = [deserialize(header)]
+    stack = [(result, 0)]
+
+    while stack:
+        container, key = stack.pop()
+        value = container[key]
+
+        if isinstance(value, dict):
+            if _wire_buffer_key in value:
+                dtype, offset, shape = value[_wire_buffer_key]
+                dtype = np.dtype(dtype)
+                count = int(np.prod(shape))
+
+                container[key] = np.frombuffer(
+                    data, dtype=dtype, count=count, offset=buffers_start + offset
+                ).reshape(shape)
+
+            else:
+                stack.extend((value, k) for k in value.keys())
+
+        elif isinstance(value, list):
+            stack.extend((value, i) for i in range(len(value)))
+
+    return result[0]
+
+
+class ReadWriteLock(object):
+    """
+    A lock that can be held by many readers at once, or by a single writer. Writers waiting for the lock
+    block new readers, so that a steady stream of readers cannot starve them. Not reentrant.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._condition:
+            while self._writing or self._writers_waiting > 0:
+                self._condition.wait()
+
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._writers_waiting += 1
+
+            while self._writing or self._readers > 0:
+                self._condition.wait()
+
+            self._writers_waiting -= 1
+            self._writing = True
+
+    def release_write(self):
+        with self._condition:
+            self._writing = False
+            self._condition.notify_all()
+
+    @contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -2,9 +2,9 @@
 # Run single test with: 'python tests/test_CommNode.py TestClassNameHere.test_method'
 
 import unittest
-import os, sys
+import os, sys, zlib
 from multiprocessing import Process, Queue
-from time import sleep
+from time import sleep, time
 from unittest import TestCase
 from blenderneuron.commnode import CommNode
 from tests import test_hoc_file, Blender, NEURON, BlenderTestCase
@@ -82,26 +82,358 @@ class TestCommNode(BlenderTestCase):
         with CommNode("Blender") as cm1:
             with CommNode("NEURON") as cm2:
 
+                # Keep the queue busy, so the tasks below are queued before any of them runs
+                cm1.client.enqueue_command('import time; time.sleep(0.2)')
+
                 task1 = cm1.client.enqueue_command('a = 1')
                 task2 = cm1.client.enqueue_command('b = 0')
                 task3 = cm1.client.enqueue_command('c = a / b')
-                task4 = cm1.client.enqueue_command('d = "never happened"')
+                task4 = cm1.client.enqueue_command('d = "independent of task3"')
+                task5 = cm1.client.enqueue_command('e = c', False, [task3])
+                task6 = cm1.client.enqueue_command('f = e', False, [task5])
 
                 i = 0
-                while i < 1 and cm1.client.get_task_status(task4) == 'QUEUED':
+                while i < 1 and cm1.client.get_task_status(task6) == 'QUEUED':
                     sleep(0.1)
                     i += 0.1
 
                 self.assertEqual(cm1.client.get_task_status(task1), 'SUCCESS')
                 self.assertEqual(cm1.client.get_task_status(task2), 'SUCCESS')
                 self.assertEqual(cm1.client.get_task_status(task3), 'ERROR')
-                self.assertEqual(cm1.client.get_task_status(task4), 'ERROR')
+
+                # Only tasks that depend on the failed task are skipped
+                self.assertEqual(cm1.client.get_task_status(task4), 'SUCCESS')
+                self.assertEqual(cm1.client.get_task_status(task5), 'ERROR')
+                self.assertEqual(cm1.client.get_task_status(task6), 'ERROR')
+                self.assertIn(str([task3]), cm1.client.get_task_error(task5))
+
+                # Dependencies must exist
+                self.assertRaises(Exception, cm1.client.enqueue_command, 'pass', False, [9999])
 
                 # Should fail on non-existing task
                 self.assertEqual(cm1.client.get_task_status(9999), "DOES_NOT_EXIST")
 
 
 
+    def test_run_command_latency(self):
+
+        with CommNode("Blender") as cm1:
+            with CommNode("NEURON") as cm2:
+                # Warm up the connections
+                cm1.client.run_command('pass')
+
+                start = time()
+                for i in range(20):
+                    cm1.client.run_command('pass')
+                elapsed = (time() - start) / 20
+
+                # Task completion should not wait on a polling interval
+                self.assertLess(elapsed, cm2.queue_wait_timeout / 2)
+
+    def test_keep_alive_connections(self):
+
+        with CommNode("Blender") as cm1:
+            with CommNode("NEURON") as cm2:
+                transport = cm1.client("transport")
+
+                for i in range(10):
+                    cm1.client.ping()
+
+                # Calls from one thread should reuse a single connection
+                self.assertEqual(1, len(transport._idle))
+                self.assertEqual(1, len(cm2.server.active_handlers))
+
+            # Kept-alive connections should not outlive the server
+            self.assertRaises(OSError, cm1.client.ping)
+
+    def test_task_eviction(self):
+
+        with CommNode("Blender") as cm1:
+            with CommNode("NEURON") as cm2:
+                client = cm1.client
+
+                # Fetched results are evicted
+                task = client.enqueue_command('return_value = 1')
+                cm2.tasks[task]["done"].wait()
+                self.assertEqual(1, client.get_task_result(task))
+                self.assertEqual("DOES_NOT_EXIST", client.get_task_status(task))
+
+                # Synchronous commands leave no tasks behind
+                client.run_command('pass')
+                self.assertEqual(0, client.get_task_stats()["size"])
+
+                # Least recently used tasks are evicted beyond max entries
+                cm2.config["task_retention"]["max_entries"] = 2
+                tasks = [client.enqueue_command('pass') for i in range(4)]
+                cm2.tasks[tasks[-1]]["done"].wait()
+                client.enqueue_command('pass')
+
+                stats = client.get_task_stats()
+                self.assertLessEqual(stats["size"], 2)
+                self.assertGreaterEqual(stats["evicted_lru"], 2)
+                self.assertEqual("DOES_NOT_EXIST", client.get_task_status(tasks[0]))
+
+                # Unfetched results expire
+                cm2.config["task_retention"]["ttl"] = 0
+                client.enqueue_command('pass')
+                self.assertGreater(client.get_task_stats()["evicted_ttl"], 0)
+
+                # Results also expire when no new tasks arrive
+                cm2.config["task_retention"]["ttl"] = 60
+                task = client.enqueue_command('pass')
+                cm2.tasks[task]["done"].wait()
+
+                cm2.config["task_retention"]["ttl"] = 0
+                sleep(0.5)
+                self.assertNotIn(task, cm2.tasks)
+
+                # Queued tasks at the head of the table are kept, the completed ones behind them are evicted
+                with cm2.task_lock:
+                    cm2.tasks["queued"] = {"id": "queued", "status": "QUEUED", "accessed": 0}
+                    cm2.tasks["done"] = {"id": "done", "status": "SUCCESS", "accessed": 0}
+                    cm2._evict_tasks()
+                    self.assertEqual(["queued"], list(cm2.tasks))
+                    cm2.tasks.pop("queued")
+
+    def test_run_batch(self):
+
+        with CommNode("Blender") as cm1:
+            with CommNode("NEURON") as cm2:
+                outcomes = cm1.client.run_batch([
+                    'return_value = 1',
+                    ['ping', []],
+                    'return_value = 1/0',
+                ])
+
+                self.assertEqual(["SUCCESS", "SUCCESS", "ERROR"], [o["status"] for o in outcomes])
+                self.assertEqual(1, outcomes[0]["result"])
+                self.assertEqual(1, outcomes[1]["result"])
+                self.assertIn("ZeroDivisionError", outcomes[2]["error"])
+
+                # Batched tasks are not retained
+                self.assertEqual(0, cm1.client.get_task_stats()["size"])
+
+                with cm1.batch() as batch:
+                    first = batch.run_command('return_value = 2')
+                    second = batch.call('ping')
+
+                self.assertEqual(2, batch.results[first])
+                self.assertEqual(1, batch.results[second])
+
+                # Errors are raised on the client
+                batch = cm1.batch()
+                batch.run_command('return_value = 1/0')
+                self.assertRaises(Exception, batch.execute)
+
+    def test_command_cache(self):
+
+        with CommNode("Blender") as cm1:
+            with CommNode("NEURON") as cm2:
+                # Imports are run once at server setup
+                self.assertTrue(cm2.imports_loaded)
+
+                for i in range(3):
+                    self.assertEqual(2, cm1.client.run_command('return_value = 1+1'))
+
+                stats = cm1.client.get_command_cache_stats()
+                self.assertEqual(1, stats["misses"])
+                self.assertEqual(2, stats["hits"])
+
+                # Least recently used commands are dropped beyond the cache size
+                cm2.config["command_cache_size"] = 2
+                for i in range(3):
+                    cm1.client.run_command('return_value = ' + str(i))
+
+                self.assertEqual(2, cm1.client.get_command_cache_stats()["size"])
+                self.assertNotIn('return_value = 0', cm2.command_cache)
+
+                # Syntax errors are reported as task errors
+                self.assertRaises(Exception, cm1.client.run_command, 'return_value = (')
+
+    def test_call_async(self):
+
+        with CommNode("Blender") as cm1:
+            with CommNode("NEURON") as cm2:
+                results = []
+                errors = []
+
+                cm1.call_async('import time; time.sleep(0.2)')
+                cm1.call_async('return_value = 1', on_done=results.append)
+                cm1.call_async(['ping', []], on_done=results.append)
+                future = cm1.call_async('return_value = 1/0', on_error=errors.append)
+
+                # Calls return before the tasks finish
+                self.assertEqual(4, cm1.poll_futures())
+
+                while cm1.poll_futures() > 0:
+                    sleep(0.01)
+
+                self.assertEqual([1, 1], results)
+                self.assertIn("ZeroDivisionError", errors[0])
+                self.assertRaises(Exception, future.result)
+
+                self.assertEqual(2, cm1.call_async('return_value = 2').result())
+
+    def test_shared_payload(self):
+        import numpy as np
+
+        with CommNode("Blender") as cm1:
+            with CommNode("NEURON") as cm2:
+                coords = np.arange(30000, dtype=np.float32)
+                payload = [{"name": "soma", "coords": coords}]
+
+                # Large payloads to a same-host client are passed as a file descriptor
+                descriptor = cm2.compress(payload)
+                self.assertIsInstance(descriptor, dict)
+                self.assertTrue(os.path.exists(descriptor["shared_payload"]))
+
+                received = cm1.decompress(descriptor)
+                self.assertTrue(np.array_equal(coords, received[0]["coords"]))
+                self.assertFalse(os.path.exists(descriptor["shared_payload"]))
+
+                # Mapped arrays are writable copies
+                received[0]["coords"][0] = -1
+                self.assertEqual(0, coords[0])
+
+                # Small payloads are sent inline
+                self.assertNotIsInstance(cm2.compress([{"coords": coords[:10]}]), dict)
+
+                # Clients that cannot read shared payloads get them inline
+                cm2.client_capabilities = {}
+                self.assertNotIsInstance(cm2.compress(payload), dict)
+                cm2.client_capabilities = {"shared_payload": True}
+
+                cm2.config["shared_memory_transfer"] = False
+                self.assertNotIsInstance(cm2.compress(payload), dict)
+
+    def test_codec_negotiation(self):
+        from blenderneuron import compression
+
+        with CommNode("Blender") as cm1:
+            with CommNode("NEURON") as cm2:
+                self.assertEqual(compression.available_codecs(), cm2.client_codecs)
+
+                # Payloads to the same host are not compressed
+                payload = [{"name": "soma", "values": list(range(1000))}]
+                encoded = cm2.compress(payload).data
+                self.assertEqual(compression.codecs['none'].codec_id, bytearray(encoded[:1])[0])
+
+                cm2.config["compression_codec"] = "zlib-9"
+                received = cm1.decompress(cm2.compress(payload))
+                self.assertEqual(list(range(1000)), list(received[0]["values"]))
+
+                # Clients without codec negotiation get zlib compressed serialized text
+                cm2.client_codecs = None
+                cm2.client_reads_wire_format = False
+                encoded = cm2.compress(payload).data
+                self.assertTrue(zlib.decompress(encoded).startswith(b"[{'name': 'soma'"))
+                self.assertEqual(payload, cm1.decompress(cm2.compress(payload)))
+
+    def test_shared_tasks(self):
+
+        with CommNode("Blender") as cm1:
+            with CommNode("NEURON") as cm2:
+                running = []
+                overlaps = []
+
+                def read():
+                    running.append(1)
+                    sleep(0.2)
+                    overlaps.append(len(running))
+                    running.pop()
+
+                def write():
+                    overlaps.append(-len(running))
+
+                cm2.register_function(read, shared=True)
+                cm2.register_function(write)
+
+                start = time()
+                futures = [cm1.call_async(['read', []]) for i in range(3)]
+                futures.append(cm1.call_async(['write', []]))
+                futures.append(cm1.call_async(['read', []]))
+
+                for future in futures:
+                    future.result()
+
+                # The reads before the write overlap, the write waits for them to finish
+                self.assertEqual(3, max(overlaps[:3]))
+                self.assertEqual(0, overlaps[3])
+                self.assertLess(time() - start, 0.6)
+
+                # Direct calls are also locked
+                self.assertEqual(None, cm1.client.write())
+
+    def test_shared_task_dependencies(self):
+
+        with CommNode("Blender") as cm1:
+            with CommNode("NEURON") as cm2:
+                calls = []
+
+                def slow_read():
+                    sleep(0.2)
+                    calls.append("slow_read")
+
+                def read():
+                    calls.append("read")
+
+                def write():
+                    calls.append("write")
+
+                cm2.register_function(slow_read, shared=True)
+                cm2.register_function(read, shared=True)
+                cm2.register_function(write)
+
+                # A shared task waiting for a shared dependency, with an exclusive task queued behind them
+                first = cm1.call_async(['slow_read', []])
+                second = cm1.call_async(['read', []], depends_on=[first])
+                third = cm1.call_async(['write', []])
+
+                start = time()
+                for future in (first, second, third):
+                    future.result()
+
+                self.assertEqual(["slow_read", "read", "write"], calls)
+                self.assertLess(time() - start, 2)
+
+    def test_batch_order(self):
+
+        with CommNode("Blender") as cm1:
+            with CommNode("NEURON") as cm2:
+                calls = []
+
+                cm2.register_function(lambda: calls.append("read"), 'read', shared=True)
+                cm2.register_function(lambda: calls.append("write"), 'write')
+
+                # Exclusive tasks run after the shared tasks queued before them
+                for i in range(20):
+                    del calls[:]
+                    cm1.client.run_batch([['read', []], ['write', []]])
+                    self.assertEqual(["read", "write"], calls)
+
+    def test_wait_for_tasks(self):
+
+        with CommNode("Blender") as cm1:
+            with CommNode("NEURON") as cm2:
+                client = cm1.client
+
+                slow = client.enqueue_command('import time; time.sleep(0.3)')
+                fast = client.enqueue_command('pass')
+
+                # Times out with the unfinished statuses
+                self.assertEqual(['QUEUED', 'QUEUED'], client.wait_for_tasks([slow, fast], 0.05))
+
+                # Returns when the tasks finish, without polling
+                start = time()
+                self.assertEqual(['SUCCESS', 'SUCCESS', 'DOES_NOT_EXIST'],
+                                 client.wait_for_tasks([slow, fast, 9999], 5))
+                self.assertLess(time() - start, 1)
+
+                # Or when any of them does
+                slow = client.enqueue_command('import time; time.sleep(0.3)')
+                blocked = client.enqueue_command('import time; time.sleep(0.3)')
+                self.assertEqual(['SUCCESS', 'QUEUED'], client.wait_for_tasks([slow, blocked], 5, True))
+
     def test_quitting_from_client(self):
         with CommNode("Blender") as cm1:
             with CommNode("NEURON") as cm2:
@@ -0,0 +1,422 @@
+# From repo root, run all tests with 'python tests/test_neuron_node.py'
+# Run single test with: 'python tests/test_neuron_node.py TestNeuronNode.test_group_stream'
+
+import unittest
+from tests import BlenderTestCase
+
+
+def skeletal_group(name, root_names, record_activity=False, granularity='Section', engine='vector'):
+    return {
+        "name": name,
+        "roots": [{"name": root_name} for root_name in root_names],
+        "record_activity": record_activity,
+        "record_variable": "v",
+        "recording_granularity": granularity,
+        "recording_period": 1.0,
+        "recording_time_start": 0,
+        "recording_time_end": 0,
+        "recording_engine": engine,
+    }
+
+
+class TestNeuronNode(BlenderTestCase):
+    def test_group_stream(self):
+        def test():
+            from neuron import h
+            from blenderneuron.nrn.neuronnode import NeuronNode
+
+            with NeuronNode() as node:
+                somas = [h.Section(name="soma" + str(i)) for i in range(5)]
+                h.tstop = 2
+
+                node.get_roots()
+
+                stream_id = node.initialize_groups([
+                    skeletal_group("Group.000", ["soma" + str(i) for i in range(5)], record_activity=True),
+                    skeletal_group("Group.001", []),
+                ], True, True)
+
+                chunks = []
+                while True:
+                    chunk = node.decompress(node.get_group_chunk(stream_id, 2))
+
+                    if len(chunk) == 0:
+                        break
+
+                    chunks.append(chunk)
+
+                # 5 roots in batches of 2
+                self.assertEqual(3, len(chunks))
+                self.assertEqual(["soma0", "soma1"], [r["name"] for r in chunks[0][0]["roots"]])
+                self.assertEqual(["soma4"], [r["name"] for r in chunks[2][0]["roots"]])
+
+                # Group-level data is only in the first chunk of a group
+                self.assertIn("activity", chunks[0][0])
+                self.assertNotIn("activity", chunks[1][0])
+
+                # The points of the roots in an entry are sent in one flat block
+                geometry = chunks[0][0]["geometry"]
+                self.assertEqual(["soma0", "soma1"], geometry["names"])
+                self.assertEqual([-1, -1], geometry["parent_indices"].tolist())
+                self.assertEqual(len(geometry["radii"]) * 3, len(geometry["coords"]))
+                self.assertNotIn("coords", chunks[0][0]["roots"][0])
+
+                # Empty groups are still sent
+                self.assertEqual("Group.001", chunks[2][1]["name"])
+                self.assertNotIn("geometry", chunks[2][1])
+
+                # Read streams are removed
+                self.assertEqual({}, node.group_streams)
+
+        self.in_separate_process(test)
+
+    def test_section_storage(self):
+        def test():
+            import numpy as np
+            from neuron import h
+            from blenderneuron.nrn.neuronnode import NeuronNode
+
+            with NeuronNode() as node:
+                soma = h.Section(name="soma")
+                h.pt3dadd(0, 0, 0, 10, sec=soma)
+                h.pt3dadd(10, 0, 0, 10, sec=soma)
+
+                node.get_roots()
+                node.initialize_groups([skeletal_group("Group.000", ["soma"])], False)
+                root = node.groups["Group.000"].roots["soma"]
+
+                # Sections have no per-instance dict
+                self.assertFalse(hasattr(root, "__dict__"))
+
+                # 3D points are stored in flat single precision arrays
+                self.assertEqual(np.float32, root.coords.dtype)
+                self.assertEqual([0, 0, 0, 10, 0, 0], root.coords.tolist())
+                self.assertEqual([5, 5], root.radii.tolist())
+
+                # And converted to lists only for the text wire format
+                self.assertIsInstance(root.to_dict()["coords"], list)
+
+        self.in_separate_process(test)
+
+    def test_network_geometry(self):
+        def test():
+            import numpy as np
+            from neuron import h
+            from blenderneuron.nrn.neuronnode import NeuronNode
+
+            with NeuronNode() as node:
+                soma = h.Section(name="soma")
+                h.pt3dadd(0, 0, 0, 10, sec=soma)
+                h.pt3dadd(10, 0, 0, 10, sec=soma)
+
+                dends = [h.Section(name="dend" + str(i)) for i in range(2)]
+
+                for i, dend in enumerate(dends):
+                    dend.connect(soma(1))
+                    h.pt3dadd(10, 0, 0, 2, sec=dend)
+                    h.pt3dadd(10, 10 * (i + 1), 0, 2, sec=dend)
+                    h.pt3dadd(10, 20 * (i + 1), 0, 2, sec=dend)
+
+                geometry = node.get_network_geometry(compressed=False)
+
+                names = geometry["names"]
+                dend1 = names.index("dend1")
+
+                # Parents are listed before their children (in NEURON's child order)
+                self.assertEqual("soma", names[0])
+                self.assertEqual({"dend0", "dend1"}, set(names[1:]))
+                self.assertEqual([-1, 0, 0], geometry["parent_indices"].tolist())
+                self.assertEqual([0, 2, 5], geometry["point_offsets"].tolist())
+                self.assertEqual([2, 3, 3], geometry["point_counts"].tolist())
+                self.assertEqual(8 * 3, len(geometry["coords"]))
+                self.assertEqual([5, 5, 1, 1, 1, 1, 1, 1], geometry["radii"].tolist())
+                self.assertTrue(np.isnan(geometry["parent_connection_locs"][0]))
+                self.assertEqual([1, 1], geometry["parent_connection_locs"][1:].tolist())
+
+                # dend1's points
+                start = geometry["point_offsets"][dend1] * 3
+                self.assertEqual([10, 0, 0, 10, 20, 0, 10, 40, 0], geometry["coords"][start:start + 9].tolist())
+
+                # Also works over the wire
+                compressed = node.get_network_geometry(["soma"])
+                self.assertEqual(geometry["names"], node.decompress(compressed)["names"])
+
+        self.in_separate_process(test)
+
+    def test_section_index_updates(self):
+        def test():
+            from neuron import h
+            from blenderneuron.nrn.neuronnode import NeuronNode
+
+            with NeuronNode() as node:
+                soma = h.Section(name="soma")
+
+                node.get_roots()
+                node.update_section_index()
+                index = node.section_index
+                self.assertEqual(["soma"], list(index.keys()))
+
+                # Unchanged topology - index is not rebuilt
+                node.update_section_index()
+                self.assertIs(index, node.section_index)
+
+                # Polling unchanged roots does not read the other sections, or invalidate the index
+                node.section_index_signature = None
+                node.get_roots()
+                self.assertIsNone(node.section_index_signature)
+                node.section_index_signature = node.get_topology_signature()
+
+                # New sections are added to the existing index
+                dend = h.Section(name="dend")
+                dend.connect(soma(1))
+
+                node.update_section_index()
+                self.assertIs(index, node.section_index)
+                self.assertEqual({"soma", "dend"}, set(node.section_index.keys()))
+
+                # Structure changes seen by NEURON, or flagged by the node, trigger a rebuild
+                h.finitialize()
+                node.update_section_index()
+                self.assertIsNot(index, node.section_index)
+
+                index = node.section_index
+                node.invalidate_section_index()
+                node.update_section_index()
+                self.assertIsNot(index, node.section_index)
+                self.assertEqual({"soma", "dend"}, set(node.section_index.keys()))
+
+        self.in_separate_process(test)
+
+    def test_section_index_replaced_cells(self):
+        def test():
+            from neuron import h
+            from blenderneuron.nrn.neuronnode import NeuronNode
+
+            with NeuronNode() as node:
+                somas = [h.Section(name="soma" + str(i)) for i in range(2)]
+
+                node.get_roots()
+
+                # Replace the cells with the same number of sections, without re-initializing
+                for soma in somas:
+                    h.delete_section(sec=soma)
+
+                somas = [h.Section(name="cell" + str(i)) for i in range(2)]
+
+                roots = node.get_roots()
+                self.assertEqual(["cell0", "cell1"], [root["name"] for root in roots])
+
+                node.update_section_index()
+                self.assertEqual({"cell0", "cell1"}, set(node.section_index.keys()))
+
+                node.initialize_groups([skeletal_group("Group.000", ["cell0", "cell1"])], send_back=False)
+                self.assertEqual(2, len(node.groups["Group.000"].roots))
+
+        self.in_separate_process(test)
+
+    def test_roots_delta(self):
+        def test():
+            from neuron import h
+            from blenderneuron.nrn.neuronnode import NeuronNode
+
+            with NeuronNode() as node:
+                cell1 = h.Section(name="cell1")
+
+                full = node.get_roots_delta()
+                self.assertTrue(full["full"])
+                self.assertEqual([{"index": 0, "name": "cell1"}], full["added"])
+
+                # Nothing changed
+                delta = node.get_roots_delta(full["version"])
+                self.assertFalse(delta["full"])
+                self.assertEqual(full["version"], delta["version"])
+                self.assertEqual(([], []), (delta["added"], delta["removed"]))
+
+                # Only the changes since the client's version are returned
+                cell2 = h.Section(name="cell2")
+                cell3 = h.Section(name="cell3")
+                delta = node.get_roots_delta(full["version"])
+                self.assertEqual({"cell2", "cell3"}, set(r["name"] for r in delta["added"]))
+                self.assertEqual([], delta["removed"])
+
+                # Connecting cell3 to cell2 removes it as a root
+                cell3.connect(cell2(1))
+                later = node.get_roots_delta(delta["version"])
+                self.assertEqual(([], ["cell3"]), (later["added"], later["removed"]))
+
+                # Changes are combined across versions
+                combined = node.get_roots_delta(full["version"])
+                self.assertEqual(["cell2"], [r["name"] for r in combined["added"]])
+                self.assertEqual([], combined["removed"])
+
+                # Disconnecting it makes it a root again
+                cell3.disconnect()
+                combined = node.get_roots_delta(delta["version"])
+                self.assertEqual(["cell3"], [r["name"] for r in combined["added"]])
+                self.assertEqual([], combined["removed"])
+
+                # Tokens from another NEURON process get the full list
+                other = node.get_roots_delta("other:" + full["version"].split(":")[1])
+                self.assertTrue(other["full"])
+                self.assertEqual(["cell1", "cell2", "cell3"], sorted(r["name"] for r in other["added"]))
+
+                # Removing a root shifts the indices of the later ones, which are sent again
+                latest = node.get_roots_delta()
+                h.delete_section(sec=cell1)
+                shifted = node.get_roots_delta(latest["version"])
+                self.assertEqual(["cell1"], shifted["removed"])
+                self.assertEqual([{"index": 0, "name": "cell2"}, {"index": 1, "name": "cell3"}], shifted["added"])
+
+                # Re-creating a root moves it to the end, without adding or removing any names
+                h.delete_section(sec=cell2)
+                cell2 = h.Section(name="cell2")
+                reordered = node.get_roots_delta(shifted["version"])
+                self.assertNotEqual(shifted["version"], reordered["version"])
+                self.assertEqual([], reordered["removed"])
+                self.assertEqual([{"index": 0, "name": "cell3"}, {"index": 1, "name": "cell2"}], reordered["added"])
+
+        self.in_separate_process(test)
+
+    def test_recording_engines(self):
+        def test():
+            import numpy as np
+            from neuron import h
+            from blenderneuron.nrn.neuronnode import NeuronNode
+
+            with NeuronNode() as node:
+                soma = h.Section(name="soma")
+                soma.insert("hh")
+                h.pt3dadd(0, 0, 0, 10, sec=soma)
+                h.pt3dadd(10, 0, 0, 10, sec=soma)
+
+                dend = h.Section(name="dend")
+                dend.connect(soma(1))
+                dend.nseg = 5
+                for x in range(4):
+                    h.pt3dadd(10 + x * 20, 0, 0, 2, sec=dend)
+
+                stim = h.IClamp(soma(0.5))
+                stim.delay, stim.dur, stim.amp = 1, 1, 1
+                h.tstop = 5
+
+                node.get_roots()
+
+                for granularity in ('3D Segment', 'Section', 'Cell', 'Group'):
+                    results = {}
+
+                    for engine in ('vector', 'callback', 'per-point'):
+                        recording_engine = 'vector' if engine == 'vector' else 'callback'
+                        group = skeletal_group("Group.000", ["soma"], True, granularity, recording_engine)
+                        node.initialize_groups([group], send_back=False)
+
+                        # Collect without the precomputed sampling plan
+                        if engine == 'per-point':
+                            node.groups["Group.000"].sampling_plan = None
+
+                        results[engine] = node.get_group_dicts(compressed=False)[0]
+
+                    vector = results["vector"]
+                    self.assertEqual(6, len(vector["activity"]["times"]))
+
+                    # All engines sample the same times and values
+                    for callback in (results["callback"], results["per-point"]):
+                        self.assert_same_activity(vector, callback)
+
+                    if granularity == '3D Segment':
+                        self.assertEqual(3, len(vector["roots"][0]["children"][0]["segment_activity"]))
+
+        self.in_separate_process(test)
+
+    def test_recording_window(self):
+        def test():
+            import numpy as np
+            from neuron import h
+            from blenderneuron.nrn.neuronnode import NeuronNode
+
+            with NeuronNode() as node:
+                soma = h.Section(name="soma")
+                soma.insert("hh")
+                h.tstop = 5
+
+                node.get_roots()
+
+                for engine in ('vector', 'callback'):
+                    for plan in (True, False):
+                        group = skeletal_group("Group.000", ["soma"], True, 'Cell', engine)
+                        group["recording_window"] = 2
+                        group["activity_quantization"] = 'fixed'
+
+                        node.initialize_groups([group], send_back=False)
+
+                        # Rolling windows use the bounded callback buffers, instead of Vectors that grow all run
+                        self.assertIsNone(node.groups["Group.000"].recorders)
+
+                        if not plan:
+                            node.groups["Group.000"].sampling_plan = None
+
+                        result = node.decompress(node.get_group_dicts())[0]
+
+                        # Only the last 2 ms are kept
+                        self.assertEqual([3, 4, 5], result["activity"]["times"].tolist())
+
+                        # Values are sent as 16 bit integers
+                        activity = result["roots"][0]["activity"]
+                        self.assertEqual(np.int16, activity["values"].dtype)
+                        self.assertIn("scale", activity)
+
+                        # Times are only sent with the group
+                        self.assertNotIn("times", activity)
+
+        self.in_separate_process(test)
+
+    def test_simplify_in_neuron(self):
+        def test():
+            from neuron import h
+            from blenderneuron.nrn.neuronnode import NeuronNode
+
+            with NeuronNode() as node:
+                soma = h.Section(name="soma")
+                h.tstop = 5
+
+                node.get_roots()
+
+                group = skeletal_group("Group.000", ["soma"], True, 'Cell')
+                group["simplify_in_neuron"] = True
+                group["simplification_epsilon"] = 0.1
+
+                node.initialize_groups([group], send_back=False)
+
+                result = node.decompress(node.get_group_dicts())[0]
+
+                # The group times are sent whole
+                self.assertEqual(6, len(result["activity"]["times"]))
+
+                # The resting potential is a line, so only its ends are sent
+                activity = result["roots"][0]["activity"]
+                self.assertEqual([0, 5], activity["time_indices"].tolist())
+                self.assertEqual(2, len(activity["values"]))
+
+        self.in_separate_process(test)
+
+    def assert_same_activity(self, vector, callback):
+        import numpy as np
+
+        self.assertTrue(np.allclose(callback["activity"]["times"], vector["activity"]["times"]))
+        self.assertTrue(np.allclose(callback["activity"]["values"], vector["activity"]["values"]))
+
+        for vector_root, callback_root in zip(vector["roots"], callback["roots"]):
+            for vector_sec, callback_sec in ((vector_root, callback_root),
+                                             (vector_root["children"][0], callback_root["children"][0])):
+                self.assertTrue(np.allclose(callback_sec["activity"]["values"],
+                                            vector_sec["activity"]["values"]))
+
+                self.assertEqual(callback_sec["segment_activity"].keys(),
+                                 vector_sec["segment_activity"].keys())
+
+                for i, act in vector_sec["segment_activity"].items():
+                    self.assertTrue(np.allclose(callback_sec["segment_activity"][i]["values"],
+                                                act["values"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,12 @@
 import unittest
+import zlib
 
-from blenderneuron.utils import serialize, deserialize
+import numpy as np
+
+from blenderneuron.utils import serialize, deserialize, pack, unpack, WIRE_FORMAT_MAGIC
+from blenderneuron import compression
+from blenderneuron.activity import Activity, SampleBuffer, quantize, dequantize, rdp_indices, rdp_batch, \
+    simplify_traces
 
 
 class TestSerialization(unittest.TestCase):
@@ -147,5 +153,256 @@ class TestSerialization(unittest.TestCase):
     #     self.assertIn("Invalid input string for deserialization", str(context.exception))
 
 
+class TestWireFormat(unittest.TestCase):
+
+    def test_pack_arrays_as_buffers(self):
+        coords = np.arange(9, dtype=np.float32)
+        data = pack({'name': 'soma', 'coords': coords})
+
+        self.assertTrue(data.startswith(WIRE_FORMAT_MAGIC))
+
+        # Floats should be in the buffer section, not the text header
+        self.assertNotIn(b'8.0', data)
+
+        result = unpack(bytearray(data))
+        self.assertEqual(result['name'], 'soma')
+        self.assertEqual(result['coords'].dtype, np.float32)
+        self.assertTrue(np.array_equal(result['coords'], coords))
+
+    def test_pack_numeric_lists(self):
+        source = [{'roots': [{'radii': [0.5, 1.5], 'children': [], 'activity': {'times': [], 'values': [1, 2]}}]}]
+        result = unpack(bytearray(pack(source)))
+
+        root = result[0]['roots'][0]
+        self.assertTrue(np.array_equal(root['radii'], [0.5, 1.5]))
+        self.assertEqual(len(root['activity']['times']), 0)
+        self.assertTrue(np.array_equal(root['activity']['values'], [1, 2]))
+        self.assertEqual(root['children'], [])
+
+        # The source payload should not be modified
+        self.assertEqual(source[0]['roots'][0]['radii'], [0.5, 1.5])
+
+    def test_pack_keeps_other_lists(self):
+        source = {'coords': ['a', 'b'], 'nested': [[1, 2], (3, None)], 'flag': True}
+        result = unpack(pack(source))
+
+        self.assertEqual(result, {'coords': ['a', 'b'], 'nested': [[1, 2], [3, None]], 'flag': True})
+
+    def test_pack_preserves_shape(self):
+        coords = np.arange(12, dtype=np.float64).reshape((4, 3))
+        result = unpack(bytearray(pack({'coords': coords})))
+
+        self.assertEqual(result['coords'].shape, (4, 3))
+        self.assertTrue(np.array_equal(result['coords'], coords))
+
+        # Arrays unpacked from a bytearray are writable
+        result['coords'][0, 0] = -1
+
+    def test_unpack_wrong_version(self):
+        data = bytearray(pack([1, 2]))
+        data[len(WIRE_FORMAT_MAGIC)] = 99
+
+        with self.assertRaises(ValueError):
+            unpack(data)
+
+
+class TestCompression(unittest.TestCase):
+
+    def test_codecs_round_trip(self):
+        data = pack([{"coords": np.arange(1000, dtype=np.float32)}])
+
+        for codec in compression.available_codecs():
+            self.assertEqual(data, compression.decode(compression.encode(data, codec)))
+
+    def test_decode_legacy_zlib(self):
+        self.assertEqual(b'payload', compression.decode(zlib.compress(b'payload', 2)))
+
+    def test_decode_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            compression.decode(b'\xff payload')
+
+    def test_select_codec(self):
+        supported = ['none', 'zlib-1', 'zlib-6']
+
+        # Compression is not worth it on the same host, or for small payloads
+        self.assertEqual('none', compression.select_codec(10 ** 6, False, supported))
+        self.assertEqual('none', compression.select_codec(100, True, supported))
+
+        # Only codecs the receiver supports are chosen
+        self.assertEqual('zlib-1', compression.select_codec(10 ** 6, True, supported))
+        self.assertEqual('none', compression.select_codec(10 ** 6, True, ['none']))
+
+        # Preferred codecs are used when supported
+        self.assertEqual('zlib-1', compression.select_codec(100, False, supported, 'zlib-1'))
+        self.assertEqual('none', compression.select_codec(100, False, supported, 'lzma'))
+
+
+
+class TestActivity(unittest.TestCase):
+
+    def test_sample_buffer_grows(self):
+        buffer = SampleBuffer(2)
+
+        for i in range(5):
+            buffer.append(i)
+
+        self.assertEqual([0, 1, 2, 3, 4], buffer.get().tolist())
+
+    def test_rolling_sample_buffer(self):
+        buffer = SampleBuffer(3, width=2, rolling=True)
+
+        for i in range(5):
+            buffer.append([i, -i])
+
+        # Keeps the latest rows, oldest first
+        self.assertEqual([[2, -2], [3, -3], [4, -4]], buffer.get().tolist())
+
+    def test_preallocated_activity(self):
+        activity = Activity(capacity=10)
+
+        for i in range(3):
+            activity.add_time(i * 0.5)
+            activity.add_value(-65 + i)
+
+        self.assertEqual([0, 0.5, 1.0], activity.times.tolist())
+        self.assertEqual([-65, -64, -63], activity.to_dict()["values"])
+
+        activity.clear()
+        self.assertEqual([], activity.values)
+
+    def test_quantize(self):
+        values = np.linspace(-80, 40, 1000)
+
+        significant = quantize([1.23456, -65.4321])["values"]
+        self.assertEqual(np.float32, significant.dtype)
+        self.assertTrue(np.allclose([1.235, -65.43], significant))
+
+        self.assertEqual(np.float16, quantize(values, 'float16')["values"].dtype)
+
+        fixed = quantize(values, 'fixed')
+        self.assertEqual(np.int16, fixed["values"].dtype)
+        self.assertTrue(np.allclose(values, dequantize(fixed), atol=120 / 65535.0))
+
+        # Unquantized values are passed through
+        self.assertIs(values, dequantize({"values": values}))
+
+        with self.assertRaises(ValueError):
+            quantize(values, 'bits')
+
+    def test_received_values_are_float64(self):
+        activity = Activity()
+        activity.times = [0.0, 1.0]
+        activity.values = [1.23456, -65.4321]
+
+        # Blender properties and keyframes need Python floats, which float32 and float16 are not
+        for quantization in ('significant', 'float16', 'fixed'):
+            received = Activity().from_dict(activity.to_dict(as_arrays=True, quantization=quantization))
+            self.assertEqual(np.float64, received.values.dtype)
+
+        received = Activity().from_dict(activity.to_dict(as_arrays=True))
+        self.assertEqual([1.235, -65.43], received.values.tolist())
+
+    def test_activity_text_values(self):
+        activity = Activity()
+        activity.values = [1.23456, -65.4321]
+
+        # Same as the '%.3E' formatting
+        self.assertEqual([1.235, -65.43], activity.to_dict()["values"])
+
+        source = activity.to_dict(quantization='fixed')
+        self.assertTrue(np.allclose([1.23456, -65.4321], Activity().from_dict(source).values, atol=1e-3))
+
+    def test_shared_time_base(self):
+        times = np.arange(5) * 0.5
+
+        activity = Activity()
+        activity.values = np.array([1.0, 3.0])
+        activity.time_indices = np.array([0, 4], dtype=np.int32)
+        activity.set_time_base(times)
+
+        self.assertEqual([0, 2], activity.times.tolist())
+
+        # Traces send the indices, but not the times
+        trace = activity.to_dict(as_arrays=True, include_times=False)
+        self.assertNotIn("times", trace)
+        self.assertEqual([0, 4], trace["time_indices"].tolist())
+
+        received = Activity().from_dict(trace)
+        received.set_time_base(times)
+        self.assertEqual([0, 2], received.times.tolist())
+
+        # Setting the times replaces the indices
+        received.times = [0, 1]
+        self.assertEqual([0, 1], received.times)
+
+    def test_simplify_keeps_time_indices(self):
+        times = np.arange(5) * 0.5
+
+        activity = Activity()
+        activity.values = np.array([0.0, 1.0, 2.0, 0.0, 0.0])
+        activity.set_time_base(times)
+        activity.simplify(0.01)
+
+        # Only the corners of the trace are kept, as indices into the shared times
+        self.assertEqual([0, 2, 3, 4], activity.time_indices.tolist())
+        self.assertEqual([0, 2, 0, 0], activity.values.tolist())
+        self.assertEqual([0, 1, 1.5, 2], activity.times.tolist())
+        self.assertIs(times, activity._times)
+
+    def test_rdp_batch(self):
+        times = np.arange(100) * 0.1
+        values = np.cumsum(np.random.RandomState(0).normal(size=(20, 100)), axis=1)
+        values[0] = 0
+
+        for epsilon in (0, 0.5, 2):
+            kept = rdp_batch(times, values, epsilon)
+
+            # Same points as simplifying each trace on its own
+            for row, indices in zip(values, kept):
+                self.assertEqual(rdp_indices(np.column_stack((times, row)), epsilon).tolist(), indices.tolist())
+
+        self.assertEqual([0, 99], kept[0].tolist())
+
+    def test_simplify_traces(self):
+        times = np.arange(5) * 0.5
+
+        activities = [Activity() for _ in range(3)]
+        activities[0].values = np.array([0.0, 1.0, 2.0, 0.0, 0.0])
+        activities[1].values = np.zeros(5)
+
+        for activity in activities:
+            activity.set_time_base(times)
+
+        simplify_traces(times, activities, 0.01)
+
+        self.assertEqual([0, 2, 3, 4], activities[0].time_indices.tolist())
+        self.assertEqual([0, 2, 0, 0], activities[0].values.tolist())
+        self.assertEqual([0, 2], activities[1].times.tolist())
+
+        # Empty traces are left as they are
+        self.assertIsNone(activities[2].time_indices)
+
+    def test_simplify_traces_in_processes(self):
+        times = np.arange(50) * 0.1
+        values = np.cumsum(np.random.RandomState(0).normal(size=(600, 50)), axis=1)
+
+        results = []
+
+        for workers in (1, 2):
+            activities = [Activity() for _ in values]
+
+            for activity, row in zip(activities, values):
+                activity.values = row
+                activity.set_time_base(times)
+
+            simplify_traces(times, activities, 0.5, batch_size=100, workers=workers)
+            results.append(activities)
+
+        # The worker processes keep the same points
+        for in_process, pooled in zip(*results):
+            self.assertEqual(in_process.time_indices.tolist(), pooled.time_indices.tolist())
+            self.assertEqual(in_process.values.tolist(), pooled.values.tolist())
+
+
 if __name__ == '__main__':
     unittest.main()